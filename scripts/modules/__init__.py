@@ -6,6 +6,8 @@ __all__ = [
     "ConfigError",
     "ConfigLoader",
     "Expectation",
+    "MatchPlan",
+    "MatchResult",
     "OutboundPlan",
     "Probe",
     "ProbeOutcome",
@@ -15,6 +17,7 @@ __all__ = [
     "StateManager",
     "TelegramNotifier",
     "TelegramSettings",
+    "TestSlot",
     "XrayAPIClient",
     "XrayAPIError",
     "XraySettings",
@@ -27,16 +30,21 @@ def __getattr__(name):
     """延迟导入模块成员"""
     if name in __all__:
         # Config 模块
-        if name in ["AppConfig", "ConfigError", "ConfigLoader", "Expectation", 
-                    "OutboundPlan", "Probe", "ProxySettings", "TelegramSettings", "XraySettings",
+        if name in ["AppConfig", "ConfigError", "ConfigLoader", "Expectation",
+                    "OutboundPlan", "Probe", "ProxySettings", "TelegramSettings", "TestSlot", "XraySettings",
                     "should_send_alert", "QUALITY_LEVELS"]:
             from .config import (
                 AppConfig, ConfigError, ConfigLoader, Expectation,
-                OutboundPlan, Probe, ProxySettings, TelegramSettings, XraySettings,
+                OutboundPlan, Probe, ProxySettings, TelegramSettings, TestSlot, XraySettings,
                 should_send_alert, QUALITY_LEVELS
             )
             return locals()[name]
         
+        # Matcher 模块
+        elif name in ["MatchPlan", "MatchResult"]:
+            from .matcher import MatchPlan, MatchResult
+            return locals()[name]
+        
         # Notifier 模块
         elif name == "TelegramNotifier":
             from .notifier import TelegramNotifier
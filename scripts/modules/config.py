@@ -2,10 +2,14 @@
 
 from __future__ import annotations
 
-import json
 from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Sequence
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from . import jsonio
+from .matcher import MatchPlan
 
 
 # 质量等级映射：数字越大问题越严重
@@ -33,13 +37,22 @@ def should_send_alert(current_quality: str, alert_level: str) -> bool:
     return current_level >= threshold_level
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
+class TestSlot:
+    """并行测试候选出站时使用的一组测试入口：代理地址及其对应的 xray inbound"""
+    proxy: str
+    inbound: str
+
+
+@dataclass(slots=True, frozen=True)
 class ProxySettings:
     prod: str
     test: str
+    # 配置两个及以上时，同一探测点的候选出站按批并行测试
+    test_slots: List[TestSlot] = field(default_factory=list)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Expectation:
     status: Optional[int] = None
     title: Optional[str] = None
@@ -51,6 +64,31 @@ class Expectation:
     fallback_expect: Optional[Dict[str, Any]] = None
     # 禁止特征检测（最差解）
     must_not: Optional[Dict[str, Any]] = None
+    # 以下为构造时编译的匹配计划
+    expect_plan: MatchPlan = field(init=False, repr=False, compare=False)
+    fallback_plan: Optional[MatchPlan] = field(init=False, repr=False, compare=False)
+    must_not_plan: Optional[MatchPlan] = field(init=False, repr=False, compare=False)
+    # 是否有条件需要页面标题 / 页面纯文本，不需要时拨测可跳过对应的提取
+    needs_title: bool = field(init=False, repr=False, compare=False)
+    needs_text: bool = field(init=False, repr=False, compare=False)
+    # 是否有选择器条件，需要解析完整的 HTML 文档
+    needs_document: bool = field(init=False, repr=False, compare=False)
+    # 是否需要页面 HTML（文本或选择器条件），只检查 status/title 时无需传输整页内容
+    needs_content: bool = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # 冻结的数据类只能在构造时通过 object.__setattr__ 写入派生字段
+        expect_plan = MatchPlan.compile(self.to_dict())
+        fallback_plan = MatchPlan.compile(self.fallback_expect) if self.fallback_expect else None
+        must_not_plan = MatchPlan.compile(self.must_not) if self.must_not else None
+        plans = [p for p in (expect_plan, fallback_plan, must_not_plan) if p]
+        object.__setattr__(self, "expect_plan", expect_plan)
+        object.__setattr__(self, "fallback_plan", fallback_plan)
+        object.__setattr__(self, "must_not_plan", must_not_plan)
+        object.__setattr__(self, "needs_title", any(p.needs_title for p in plans))
+        object.__setattr__(self, "needs_text", any(p.needs_text for p in plans))
+        object.__setattr__(self, "needs_document", any(p.needs_document for p in plans))
+        object.__setattr__(self, "needs_content", any(p.needs_content for p in plans))
 
     def to_dict(self) -> Dict[str, Any]:
         result = {}
@@ -64,22 +102,24 @@ class Expectation:
         return result
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class OutboundPlan:
     candidates: List[str] = field(default_factory=list)
     tags: List[str] = field(default_factory=list)
     replace: bool = False
 
     def priority(self, defaults: Sequence[str]) -> List[str]:
-        ordered: List[str] = []
-        ordered.extend(self.candidates)
-        ordered.extend(self.tags)
-        if not self.replace:
-            ordered.extend(defaults)
-        return dedupe_preserve_order(ordered)
+        return list(_priority(tuple(self.candidates), tuple(self.tags), self.replace, tuple(defaults)))
+
 
+@lru_cache(maxsize=None)
+def _priority(candidates: Tuple[str, ...], tags: Tuple[str, ...], replace: bool, defaults: Tuple[str, ...]) -> Tuple[str, ...]:
+    """出站优先级：candidates → tags → defaults（replace 时不含 defaults），去重保序；同一组输入只计算一次"""
+    ordered = candidates + tags if replace else candidates + tags + defaults
+    return tuple(dedupe_preserve_order(ordered))
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class Probe:
     name: str
     url: str
@@ -88,21 +128,27 @@ class Probe:
     rules: Optional[Dict[str, Any]] = None
     wait_seconds: Optional[int] = None
     alert_level: Optional[str] = None  # 告警等级阈值：optimal/suboptimal/blocked
+    engine: str = "browser"  # 拨测方式：browser(Playwright) / http(aiohttp 直接请求，不执行 JS)
+    # 从 url 解析出的域名，构造时计算一次
+    domain: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "domain", extract_domain(self.url))
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class XraySettings:
     api: str
     exe: str = "xray"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TelegramSettings:
     bot_token: str
     chat_id: str
     enabled: bool = True
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AppConfig:
     proxy: ProxySettings
     probes: List[Probe]
@@ -115,16 +161,20 @@ class AppConfig:
     state_file: str = "state.json"
     suboptimal_skip_hours: int = 1
     alert_level: str = "suboptimal"  # 全局告警等级阈值：optimal/suboptimal/blocked
+    probe_concurrency: int = 4  # 同时进行的探测点数量上限
+
+
+def extract_domain(url: str) -> str:
+    parsed = urlparse(url)
+    host = parsed.hostname
+    if not host:
+        raise ConfigError(f"URL 无法解析域名: {url}")
+    return host
 
 
 def dedupe_preserve_order(items: Iterable[str]) -> List[str]:
-    seen: set[str] = set()
-    result: List[str] = []
-    for item in items:
-        if item not in seen:
-            seen.add(item)
-            result.append(item)
-    return result
+    # dict 保持插入顺序，一次 C 层遍历完成去重
+    return list(dict.fromkeys(items))
 
 
 class ConfigError(RuntimeError):
@@ -134,47 +184,45 @@ class ConfigError(RuntimeError):
 class ConfigLoader:
     @staticmethod
     def load(path: Path) -> AppConfig:
-        if not path.exists():
-            raise ConfigError(f"配置文件不存在: {path}")
+        """加载配置；返回的配置对象是冻结的，会在多次调用间共享"""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            raise ConfigError(f"配置文件不存在: {path}") from None
+        # 文件未修改时直接复用上次解析的结果
+        return ConfigLoader._load_cached(path, stat.st_mtime_ns, stat.st_size)
 
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _load_cached(path: Path, mtime_ns: int, size: int) -> AppConfig:
         try:
-            raw = json.loads(path.read_text(encoding="utf-8"))
-        except json.JSONDecodeError as exc:
+            raw = jsonio.loads(path.read_bytes())
+        except jsonio.JSONDecodeError as exc:
             raise ConfigError(f"配置文件解析失败: {exc}") from exc
 
         try:
             proxy_raw = raw["proxy"]
-            proxy = ProxySettings(prod=proxy_raw["prod"], test=proxy_raw["test"])
+            proxy = ProxySettings(
+                prod=proxy_raw["prod"],
+                test=proxy_raw["test"],
+                test_slots=[
+                    TestSlot(proxy=slot["proxy"], inbound=slot["inbound"])
+                    for slot in proxy_raw.get("test_slots", []) or []
+                ],
+            )
 
             # 获取全局alert_level
             global_alert_level = raw.get("alert_level", "suboptimal")
             
             probes_raw = raw.get("playwright_probes", [])
             probes: List[Probe] = []
-            for entry in probes_raw:
-                expect_raw = entry.get("expect", {})
-                outbound_raw = entry.get("outbounds", {})
-                probe = Probe(
-                    name=entry["name"],
-                    url=entry["url"],
-                    expect=Expectation(
-                        status=expect_raw.get("status"),
-                        title=expect_raw.get("title"),
-                        body=expect_raw.get("body"),
-                        captcha_keywords=expect_raw.get("captcha_keywords", []),
-                        fallback_expect=expect_raw.get("fallback_expect"),
-                        must_not=expect_raw.get("must_not"),
-                    ),
-                    outbound_plan=OutboundPlan(
-                        candidates=outbound_raw.get("candidates", []) or [],
-                        tags=outbound_raw.get("tags", []) or [],
-                        replace=bool(outbound_raw.get("replace", False)),
-                    ),
-                    rules=entry.get("rules"),
-                    wait_seconds=entry.get("wait_seconds"),
-                    alert_level=entry.get("alert_level", global_alert_level),  # 优先使用probe级别，否则使用全局
-                )
-                probes.append(probe)
+            for index, entry in enumerate(probes_raw):
+                try:
+                    probes.append(ConfigLoader._parse_probe(entry, global_alert_level))
+                except KeyError as exc:
+                    raise ConfigError(f"第 {index + 1} 个探测点缺少关键字段: {exc}") from exc
+                except (TypeError, AttributeError) as exc:
+                    raise ConfigError(f"第 {index + 1} 个探测点配置格式错误: {exc}") from exc
 
             # 支持两种配置方式：
             # 1. 旧版本：单个 xray 配置（向后兼容）
@@ -225,8 +273,38 @@ class ConfigLoader:
                 telegram=telegram,
                 state_file=raw.get("state_file", "state.json"),
                 suboptimal_skip_hours=raw.get("suboptimal_skip_hours", 1),
+                probe_concurrency=raw.get("probe_concurrency", 4),
             )
             return config
         except KeyError as exc:
             raise ConfigError(f"配置缺少关键字段: {exc}") from exc
+        except (TypeError, AttributeError) as exc:
+            # 字段类型不符（如应为对象的字段写成了列表或字符串）
+            raise ConfigError(f"配置格式错误: {exc}") from exc
+
+    @staticmethod
+    def _parse_probe(entry: Dict[str, Any], global_alert_level: str) -> Probe:
+        expect_raw = entry.get("expect", {})
+        outbound_raw = entry.get("outbounds", {})
+        return Probe(
+            name=entry["name"],
+            url=entry["url"],
+            expect=Expectation(
+                status=expect_raw.get("status"),
+                title=expect_raw.get("title"),
+                body=expect_raw.get("body"),
+                captcha_keywords=expect_raw.get("captcha_keywords", []),
+                fallback_expect=expect_raw.get("fallback_expect"),
+                must_not=expect_raw.get("must_not"),
+            ),
+            outbound_plan=OutboundPlan(
+                candidates=outbound_raw.get("candidates", []) or [],
+                tags=outbound_raw.get("tags", []) or [],
+                replace=bool(outbound_raw.get("replace", False)),
+            ),
+            rules=entry.get("rules"),
+            wait_seconds=entry.get("wait_seconds"),
+            alert_level=entry.get("alert_level", global_alert_level),  # 优先使用probe级别，否则使用全局
+            engine=entry.get("engine", "browser"),
+        )
 
@@ -0,0 +1,32 @@
+"""Shared aiohttp helpers"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+# 可选：aiodns 异步解析器，None 表示尚未检查，False 表示未安装
+_aiodns_available = None
+
+
+def create_dns_resolver(aiohttp) -> Any:
+    """
+    返回 aiohttp 的 DNS 解析器：安装了 aiodns 时使用 AsyncResolver，否则返回 None 使用默认解析器
+
+    需要在事件循环中调用。连接器的 DNS 缓存（ttl_dns_cache）只在同一连接器内生效，
+    因此各 aiohttp 会话都应在整个运行期间复用。
+    """
+    global _aiodns_available
+    if _aiodns_available is None:
+        try:
+            import aiodns  # noqa: F401
+            _aiodns_available = True
+        except ImportError:
+            _aiodns_available = False
+    if not _aiodns_available:
+        return None
+    try:
+        return aiohttp.AsyncResolver()
+    except Exception as exc:
+        logging.debug("创建 AsyncResolver 失败，使用默认解析器: %s", exc)
+        return None
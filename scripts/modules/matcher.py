@@ -0,0 +1,266 @@
+"""Match plans compiled from expect / fallback_expect / must_not configs"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    import ahocorasick  # 可选：多关键字单遍匹配
+except ImportError:
+    ahocorasick = None
+
+# 关键字达到该数量时才使用自动机：为保持配置顺序需遍历全部命中，关键字较少时
+# 逐个子串查找（命中即返回）更快，约 50 个关键字时两者耗时相当
+_AUTOMATON_MIN_KEYWORDS = 64
+
+# soupsieve 随 bs4 安装，导入时会连带导入 bs4，因此只在首次编译选择器时导入
+_soupsieve = None
+
+
+@dataclass(slots=True)
+class MatchResult:
+    """匹配结果"""
+    matched: bool
+    reason: str
+
+
+@dataclass(slots=True)
+class MatchContext:
+    """
+    一次拨测的页面信息
+
+    title_lc / text_lc 为已转小写的页面标题和纯文本；
+    document 为已解析的 HTML 文档（见 probe.HtmlDocument），未获取页面内容时为 None。
+    """
+    status: Optional[int]
+    title_lc: str = ""
+    text_lc: str = ""
+    document: Any = None
+
+
+def _as_list(value: Any) -> List[Any]:
+    return value if isinstance(value, list) else [value]
+
+
+@dataclass(slots=True)
+class StatusMatcher:
+    statuses: List[Any]
+
+    def __call__(self, ctx: MatchContext) -> MatchResult:
+        if ctx.status not in self.statuses:
+            return MatchResult(matched=False, reason=f"状态码不匹配: 期望 {self.statuses}, 实际 {ctx.status}")
+        return MatchResult(matched=True, reason=f"status: {ctx.status}")
+
+
+@dataclass(slots=True)
+class TitleMatcher:
+    titles: List[str]
+    titles_lc: List[str]
+
+    def __call__(self, ctx: MatchContext) -> MatchResult:
+        for expected_title, expected_lc in zip(self.titles, self.titles_lc):
+            if expected_lc in ctx.title_lc:
+                return MatchResult(matched=True, reason=f"title: {expected_title}")
+        return MatchResult(matched=False, reason=f"标题不匹配: 期望包含 {self.titles}")
+
+
+@dataclass(slots=True)
+class ContainsMatcher:
+    contains: List[str]
+    contains_lc: List[str]
+    # contains 关键字的 Aho-Corasick 自动机（需要 pyahocorasick，且关键字较多时才构建）
+    automaton: Any = None
+
+    def __call__(self, ctx: MatchContext) -> MatchResult:
+        expected_text = self.find(ctx.text_lc)
+        if expected_text is None:
+            return MatchResult(matched=False, reason=f"文本不匹配: 期望包含 {self.contains}")
+        return MatchResult(matched=True, reason=f"contains:{expected_text}")
+
+    def find(self, text_lc: str) -> Optional[str]:
+        """返回出现在小写文本中、配置顺序最靠前的关键字（原始大小写），没有则返回 None"""
+        if self.automaton is not None:
+            return self._first_in_config(index for _, index in self.automaton.iter(text_lc))
+        for expected_text, expected_lc in zip(self.contains, self.contains_lc):
+            if expected_lc in text_lc:
+                return expected_text
+        return None
+
+    def _first_in_config(self, indexes: Iterable[int]) -> Optional[str]:
+        """在所有命中中取配置位置最小的关键字，与逐个按配置顺序查找的结果一致"""
+        best = None
+        for index in indexes:
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    break
+        return self.contains[best] if best is not None else None
+
+
+@dataclass(slots=True)
+class SelectorMatcher:
+    """
+    CSS 选择器匹配
+
+    Examples:
+        # 简单选择器
+        {"selector": ".error-message"}
+
+        # 选择器 + 文本匹配
+        {"selector": ".error-message", "text": "Access Denied"}
+
+        # 高级配置
+        {"selector": {"css": ".message", "text": "error", "attr": "class"}}
+    """
+    css: Optional[str]
+    # 预编译的 CSS 选择器（需要 soupsieve），首次使用时编译，False 表示无法编译
+    compiled: Any = None
+    # 配置错误时的原因，匹配时直接返回不匹配
+    error: Optional[str] = None
+    attr: Optional[str] = None
+    attr_value: Any = None
+    texts: Optional[List[str]] = None
+    texts_lc: List[str] = field(default_factory=list)
+
+    def __call__(self, ctx: MatchContext) -> MatchResult:
+        if self.error:
+            return MatchResult(matched=False, reason=self.error)
+        try:
+            document = ctx.document
+            elements = document.select(self.css, self.compile_css)
+            if not elements:
+                return MatchResult(matched=False, reason=f"未找到选择器: {self.css}")
+
+            # 检查属性
+            if self.attr is not None:
+                for element in elements:
+                    value = document.element_attr(element, self.attr)
+                    if value is not None:
+                        if self.attr_value is None or self.attr_value in value:
+                            return MatchResult(matched=True, reason=f"selector:找到属性 {self.attr}")
+                return MatchResult(matched=False, reason=f"未找到属性: {self.attr}")
+
+            # 检查文本
+            if self.texts:
+                for element in elements:
+                    element_text_lc = document.element_text(element).lower()
+                    for pattern, pattern_lc in zip(self.texts, self.texts_lc):
+                        if pattern_lc in element_text_lc:
+                            return MatchResult(matched=True, reason=f"selector:选择器 {self.css} 匹配文本: {pattern}")
+                return MatchResult(matched=False, reason=f"选择器 {self.css} 未找到文本: {self.texts}")
+
+            # 只要找到元素就算匹配
+            return MatchResult(matched=True, reason=f"selector:找到选择器: {self.css}")
+        except Exception as exc:
+            logging.warning("选择器匹配失败: %s", exc)
+            return MatchResult(matched=False, reason=f"选择器匹配异常: {exc}")
+
+    def compile_css(self) -> Any:
+        """返回预编译的选择器，无法编译时返回 None；只有 BeautifulSoup 后端会调用"""
+        if self.compiled is None:
+            self.compiled = _compile_css(self.css) or False
+        return self.compiled or None
+
+
+Matcher = Callable[[MatchContext], MatchResult]
+
+
+@dataclass(slots=True)
+class MatchPlan:
+    """
+    预编译的匹配计划
+
+    加载配置时把条件字典编译成按 status → title → selector → contains 顺序执行的匹配器，
+    单值包装成列表、文本模式转小写等工作只做一次。
+    """
+    raw: Dict[str, Any]
+    matchers: List[Matcher] = field(default_factory=list)
+    needs_title: bool = False
+    needs_text: bool = False
+    # 选择器条件需要完整的 HTML 文档
+    needs_document: bool = False
+    needs_content: bool = False
+
+    @classmethod
+    def compile(cls, config: Dict[str, Any]) -> "MatchPlan":
+        plan = cls(raw=config)
+        if "status" in config:
+            plan.matchers.append(StatusMatcher(_as_list(config["status"])))
+        if "title" in config:
+            titles = _as_list(config["title"])
+            plan.matchers.append(TitleMatcher(titles, [title.lower() for title in titles]))
+            plan.needs_title = True
+        if "selector" in config:
+            plan.matchers.append(_compile_selector_matcher(config))
+            plan.needs_document = plan.needs_content = True
+        if "contains" in config:
+            contains = _as_list(config["contains"])
+            contains_lc = [text.lower() for text in contains]
+            plan.matchers.append(_compile_contains_matcher(contains, contains_lc))
+            plan.needs_text = plan.needs_content = True
+        return plan
+
+    def match(self, ctx: MatchContext) -> MatchResult:
+        """依次执行匹配器，任一不匹配即返回；没有任何检查项时视为匹配"""
+        matched_reasons = []
+        for matcher in self.matchers:
+            result = matcher(ctx)
+            if not result.matched:
+                return result
+            matched_reasons.append(result.reason)
+        return MatchResult(matched=True, reason=';'.join(matched_reasons))
+
+
+def _compile_selector_matcher(config: Dict[str, Any]) -> SelectorMatcher:
+    """字符串选择器取同级 text 作为文本模式，字典选择器取其自身的 css/text/attr 字段"""
+    selector_config = config["selector"]
+    if isinstance(selector_config, str):
+        css = selector_config
+        text_pattern = config.get("text")
+        matcher = SelectorMatcher(css=css)
+    elif isinstance(selector_config, dict):
+        css = selector_config.get("css")
+        if not css:
+            return SelectorMatcher(css=None, error="选择器配置缺少 css 字段")
+        text_pattern = selector_config.get("text")
+        matcher = SelectorMatcher(css=css, attr=selector_config.get("attr"), attr_value=selector_config.get("attr_value"))
+    else:
+        return SelectorMatcher(css=None, error="无效的选择器配置")
+
+    if text_pattern:
+        matcher.texts = _as_list(text_pattern)
+        matcher.texts_lc = [text.lower() for text in matcher.texts]
+    return matcher
+
+
+def _compile_contains_matcher(contains: List[str], contains_lc: List[str]) -> ContainsMatcher:
+    """关键字很多时预编译为自动机，否则按配置顺序逐个子串查找"""
+    return ContainsMatcher(contains, contains_lc, automaton=_build_automaton(contains_lc))
+
+
+def _compile_css(css_selector: Any) -> Any:
+    """预编译 CSS 选择器，无法编译时返回 None，由匹配阶段报告错误"""
+    global _soupsieve
+    if not isinstance(css_selector, str):
+        return None
+    try:
+        if _soupsieve is None:
+            import soupsieve as _soupsieve
+        return _soupsieve.compile(css_selector)
+    except Exception:
+        return None
+
+
+def _build_automaton(patterns: List[str]) -> Any:
+    """为大量关键字构建自动机，一次扫描即可匹配全部关键字"""
+    if ahocorasick is None or len(patterns) < _AUTOMATON_MIN_KEYWORDS or not all(patterns):
+        return None
+    automaton = ahocorasick.Automaton()
+    for index, pattern in enumerate(patterns):
+        # 重复的关键字保留配置中的首个位置
+        if not automaton.exists(pattern):
+            automaton.add_word(pattern, index)
+    automaton.make_automaton()
+    return automaton
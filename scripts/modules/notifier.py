@@ -6,18 +6,72 @@ import logging
 from typing import Optional
 
 from .config import TelegramSettings
+from .http_util import create_dns_resolver
+
+# api.telegram.org 的解析结果在整个运行期间缓存，多条告警只解析一次
+_DNS_CACHE_TTL = 600
+
+# aiohttp 导入耗时较长，首次发送告警时才导入；False 表示未安装
+_aiohttp = None
+
+
+def _get_aiohttp():
+    global _aiohttp
+    if _aiohttp is None:
+        try:
+            import aiohttp as _aiohttp
+        except ImportError:
+            _aiohttp = False
+    return _aiohttp or None
 
 
 class TelegramNotifier:
+    """
+    Telegram 告警发送器
+
+    多次告警复用同一个 aiohttp 会话（连接池），避免每条消息重新建立 TLS 连接。
+    作为 async with 上下文使用，退出时关闭会话。
+    """
+
     def __init__(self, settings: Optional[TelegramSettings]) -> None:
         self._settings = settings
+        self._session: Optional["aiohttp.ClientSession"] = None
+        # 请求地址在整个运行期间不变，只拼接一次
+        self._url = f"https://api.telegram.org/bot{settings.bot_token}/sendMessage" if settings else None
+
+    @property
+    def enabled(self) -> bool:
+        """是否配置并启用了 Telegram 通知"""
+        return bool(self._settings and self._settings.enabled)
+
+    async def __aenter__(self) -> "TelegramNotifier":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """关闭复用的 HTTP 会话"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self, aiohttp) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(ttl_dns_cache=_DNS_CACHE_TTL, resolver=create_dns_resolver(aiohttp))
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+        return self._session
 
     async def send_alert(self, message: str) -> None:
-        if not self._settings or not self._settings.enabled:
+        if not self.enabled:
             logging.debug("Telegram 通知未启用")
             return
 
-        url = f"https://api.telegram.org/bot{self._settings.bot_token}/sendMessage"
+        aiohttp = _get_aiohttp()
+        if aiohttp is None:
+            logging.error("Telegram 通知需要安装 aiohttp: pip install aiohttp")
+            return
+
         payload = {
             "chat_id": self._settings.chat_id,
             "text": message,
@@ -25,16 +79,11 @@ class TelegramNotifier:
         }
 
         try:
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                    if response.status == 200:
-                        logging.info("Telegram 告警发送成功")
-                    else:
-                        error_text = await response.text()
-                        logging.error("Telegram 告警发送失败: %s - %s", response.status, error_text)
-        except ImportError:
-            logging.error("Telegram 通知需要安装 aiohttp: pip install aiohttp")
+            async with self._get_session(aiohttp).post(self._url, json=payload) as response:
+                if response.status == 200:
+                    logging.info("Telegram 告警发送成功")
+                else:
+                    error_text = await response.text()
+                    logging.error("Telegram 告警发送失败: %s - %s", response.status, error_text)
         except Exception as exc:
             logging.error("Telegram 告警发送异常: %s", exc)
-
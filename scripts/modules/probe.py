@@ -2,103 +2,348 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
-from dataclasses import dataclass
+import re
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
-
-from bs4 import BeautifulSoup
-from playwright.async_api import (
-    Browser,
-    Error as PlaywrightError,
-    Playwright,
-    TimeoutError as PlaywrightTimeoutError,
-    async_playwright,
-)
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
 
 from .config import Probe
+from .http_util import create_dns_resolver
+from .matcher import MatchContext
+
+try:
+    # C 实现的 lexbor 解析器，解析和提取文本比 BeautifulSoup 快一个数量级
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml  # noqa: F401  C 实现的解析器，构建 DOM 更快
+    _HTML_PARSER = "lxml"
+except ImportError:
+    _HTML_PARSER = "html.parser"
+
+# 一次往返同时取回标题和 HTML
+_READ_PAGE_SCRIPT = "() => ({title: document.title, html: document.documentElement.outerHTML})"
+
+# 在浏览器内提取纯文本（跳过 script/style，合并空白），与 HtmlDocument.text() 的结果一致
+_READ_TEXT_SCRIPT = """() => {
+    const root = document.documentElement || document;
+    const walker = document.createTreeWalker(root, NodeFilter.SHOW_TEXT);
+    const parts = [];
+    for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+        const tag = node.parentElement && node.parentElement.tagName;
+        if (tag !== "SCRIPT" && tag !== "STYLE") parts.push(node.data);
+    }
+    return {title: document.title, text: parts.join(" ").split(/\\s+/).filter(Boolean).join(" ")};
+}"""
+
+if TYPE_CHECKING:
+    from playwright.async_api import Browser, Playwright
+
+# 提取纯文本时忽略的标签
+_NON_TEXT_TAGS = ("script", "style")
+
+# bs4 / playwright 导入耗时较长，首次使用时才导入，只加载配置的调用方无需付出这部分开销
+_bs4 = None
+_playwright_api = None
+# HTTP 拨测的可选依赖，False 表示未安装
+_aiohttp = None
+_aiohttp_socks = None
+
+# HTTP 拨测连接池：每个代理一个会话，限制并发连接并缓存 DNS
+_HTTP_CONNECTION_LIMIT = 32
+_HTTP_DNS_CACHE_TTL = 600
+
+
+def _get_bs4():
+    global _bs4
+    if _bs4 is None:
+        import bs4 as _bs4
+    return _bs4
+
+
+def _get_playwright_api():
+    global _playwright_api
+    if _playwright_api is None:
+        import playwright.async_api as _playwright_api
+    return _playwright_api
 
 
-@dataclass
+def _get_aiohttp():
+    global _aiohttp
+    if _aiohttp is None:
+        try:
+            import aiohttp as _aiohttp
+        except ImportError:
+            _aiohttp = False
+    return _aiohttp or None
+
+
+def _http_errors(aiohttp) -> Tuple[type, ...]:
+    """
+    HTTP 拨测中表示出站不可用的异常
+
+    socks 连接器不经 aiohttp 包装，代理错误以 aiohttp_socks 自身的异常或 OSError 抛出；
+    代理地址格式错误时抛出 ValueError。
+    """
+    errors: Tuple[type, ...] = (aiohttp.ClientError, OSError, ValueError)
+    aiohttp_socks = _get_aiohttp_socks()
+    if aiohttp_socks is not None:
+        errors += (aiohttp_socks.ProxyError, aiohttp_socks.ProxyConnectionError, aiohttp_socks.ProxyTimeoutError)
+    return errors
+
+
+def _get_aiohttp_socks():
+    global _aiohttp_socks
+    if _aiohttp_socks is None:
+        try:
+            import aiohttp_socks as _aiohttp_socks
+        except ImportError:
+            _aiohttp_socks = False
+    return _aiohttp_socks or None
+
+
+@dataclass(slots=True)
 class ProbeOutcome:
     ok: bool
     reason: Optional[str] = None
     status: Optional[int] = None
     quality: str = "optimal"  # optimal(最优), suboptimal(次优-有验证码), blocked(最差-被禁止)
     request_latency_ms: int = 0  # 首次请求响应耗时
+    screenshot_data: Optional[bytes] = field(default=None, repr=False)  # 非最优结果的页面截图(PNG)
 
 
 class PlaywrightProbe:
+    """
+    Playwright 探测器
+
+    同一实例内复用 Playwright 运行时和同一个浏览器，代理在 BrowserContext 上设置，
+    每次拨测只新建一个 BrowserContext，生产/测试代理之间切换无需重启浏览器。推荐用法：
+
+        async with PlaywrightProbe(timeout_ms=20000) as probe:
+            outcome = await probe.check(...)
+    """
+
     def __init__(self, timeout_ms: int, user_agent: Optional[str] = None) -> None:
         self._timeout_ms = timeout_ms
         self._user_agent = user_agent
+        self._playwright: Optional[Playwright] = None
+        self._browser: Optional[Browser] = None
+        # engine=http 的探测点使用的 aiohttp 会话，按代理地址缓存
+        self._http_sessions: Dict[str, Any] = {}
+        # 并发拨测时避免重复启动浏览器
+        self._launch_lock = asyncio.Lock()
+        # 后台写入中的截图文件，关闭前等待全部完成
+        self._pending_writes: Set[asyncio.Task] = set()
+        # 每个截图路径最近一次的写入任务，同一路径的写入依次执行
+        self._last_write: Dict[Path, asyncio.Task] = {}
+
+    async def __aenter__(self) -> "PlaywrightProbe":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """等待截图写完，关闭浏览器、HTTP 会话并停止 Playwright"""
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        sessions = list(self._http_sessions.values())
+        self._http_sessions.clear()
+        for session in sessions:
+            try:
+                await session.close()
+            except Exception as e:
+                logging.debug("HTTP 会话关闭异常: %s", e)
+        browser, self._browser = self._browser, None
+        if browser is not None and browser.is_connected():
+            # 为 browser.close() 添加超时保护，避免永久阻塞
+            try:
+                await asyncio.wait_for(browser.close(), timeout=5.0)
+            except asyncio.TimeoutError:
+                logging.warning("浏览器关闭超时(5秒)，已跳过")
+            except Exception as e:
+                logging.debug("浏览器关闭异常: %s", e)
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception as e:
+                logging.debug("Playwright 停止异常: %s", e)
+            self._playwright = None
 
     async def check(self, probe: Probe, proxy_url: str) -> ProbeOutcome:
-        import time
-        import asyncio
-        
-        browser = None
+        # engine=http 的探测点直接发 HTTP 请求，缺少依赖时退回浏览器
+        if probe.engine == "http":
+            outcome = await self._check_http(probe, proxy_url)
+            if outcome is not None:
+                return outcome
+        return await self._check_browser(probe, proxy_url)
+
+    async def _check_browser(self, probe: Probe, proxy_url: str) -> ProbeOutcome:
+        api = _get_playwright_api()
+        context = None
+        page = None
         try:
-            async with async_playwright() as p:
-                browser = await self._launch_browser(p, proxy_url)
+            browser = await self._get_browser()
+            try:
+                context_options = {"proxy": {"server": proxy_url}}
+                if self._user_agent:
+                    context_options["user_agent"] = self._user_agent
+                
+                context = await browser.new_context(**context_options)
+                page = await context.new_page()
+                
+                # 测量纯网络请求延迟（到服务器响应返回）
+                start_time = time.perf_counter()
+                response = await page.goto(probe.url, wait_until="commit", timeout=self._timeout_ms)
+                request_latency = self._request_latency_ms(response, start_time)
+                
+                status = response.status if response else None
+        
+                if status is None:
+                    logging.error("状态码为空: %s", probe.url)
+                    return ProbeOutcome(ok=False, reason="状态码为空", status=status, quality="blocked", request_latency_ms=request_latency)
+
+                # 等待 DOM 加载完成以便后续内容检查；超时不判失败，按已加载的内容继续检查
                 try:
-                    context_options = {}
-                    if self._user_agent:
-                        context_options["user_agent"] = self._user_agent
-                    
-                    context = await browser.new_context(**context_options)
-                    page = await context.new_page()
-                    
-                    # 测量纯网络请求延迟（到服务器响应返回）
-                    start_time = time.time()
-                    response = await page.goto(probe.url, wait_until="commit", timeout=self._timeout_ms)
-                    request_latency = int((time.time() - start_time) * 1000)
-                    
-                    status = response.status if response else None
-            
-                    if status is None:
-                        logging.error("状态码为空: %s", probe.url)
-                        return ProbeOutcome(ok=False, reason="状态码为空", status=status, quality="blocked", request_latency_ms=request_latency)
+                    await page.wait_for_load_state("domcontentloaded", timeout=self._timeout_ms)
+                except api.TimeoutError:
+                    logging.warning("%s DOM 加载超时，继续检查", probe.name)
 
-                    # 等待 DOM 加载完成以便后续内容检查
-                    try:
-                        await page.wait_for_load_state("domcontentloaded", timeout=self._timeout_ms)
-                    except PlaywrightTimeoutError:
-                        logging.warning("%s DOM 加载超时，继续检查", probe.name)
-                    
-                    # 如果配置了等待时间，等待指定秒数（用于等待 JavaScript 动态内容）
-                    if probe.wait_seconds is not None and probe.wait_seconds > 0:
-                        logging.debug("%s 等待 %d 秒以加载动态内容", probe.name, probe.wait_seconds)
-                        await page.wait_for_timeout(probe.wait_seconds * 1000)
-                    
-                    # 检查质量等级
-                    quality_result = await self._check_quality(probe, page, status)
-                    quality_result.request_latency_ms = request_latency
-                    return quality_result
-                    
-                except PlaywrightTimeoutError:
+                # 如果配置了等待时间，等待指定秒数（用于等待 JavaScript 动态内容）
+                if probe.wait_seconds is not None and probe.wait_seconds > 0:
+                    logging.debug("%s 等待 %d 秒以加载动态内容", probe.name, probe.wait_seconds)
+                    await page.wait_for_timeout(probe.wait_seconds * 1000)
+                
+                # 检查质量等级
+                quality_result = await self._check_quality(probe, page, status, proxy_url)
+                quality_result.request_latency_ms = request_latency
+                return quality_result
+                
+            except api.TimeoutError:
+                screenshot_data = await self._save_screenshot(page, probe.name, "timeout", proxy_url) if page is not None else None
+                return ProbeOutcome(ok=False, reason="页面加载超时", quality="blocked", screenshot_data=screenshot_data)
+            finally:
+                # 只关闭本次拨测的 context，浏览器留给后续拨测复用
+                if context is not None:
                     try:
-                        await page.screenshot(path=f"screenshots/{probe.name}-timeout.png")
-                    except:
-                        pass
-                    return ProbeOutcome(ok=False, reason="页面加载超时", quality="blocked")
-                finally:
-                    # 为 browser.close() 添加超时保护，避免永久阻塞
-                    if browser and browser.is_connected():
-                        try:
-                            await asyncio.wait_for(browser.close(), timeout=5.0)
-                        except asyncio.TimeoutError:
-                            logging.warning("%s 浏览器关闭超时(5秒)，已跳过", probe.name)
-                        except Exception as e:
-                            logging.debug("%s 浏览器关闭异常: %s", probe.name, e)
-
-        except PlaywrightError as exc:
+                        await asyncio.wait_for(context.close(), timeout=5.0)
+                    except asyncio.TimeoutError:
+                        logging.warning("%s 浏览器上下文关闭超时(5秒)，已跳过", probe.name)
+                    except Exception as e:
+                        logging.debug("%s 浏览器上下文关闭异常: %s", probe.name, e)
+
+        except api.Error as exc:
             return ProbeOutcome(ok=False, reason=f"Playwright错误: {exc}", quality="blocked")
 
-    async def _launch_browser(self, playwright: Playwright, proxy_url: str) -> Browser:
+    async def _check_http(self, probe: Probe, proxy_url: str) -> Optional[ProbeOutcome]:
+        """
+        不启动浏览器，通过 aiohttp 直接请求页面并按同样的期望条件判定
+
+        不执行 JavaScript，wait_seconds 不生效，也不保存截图。
+        代理不受支持（如 socks 代理未安装 aiohttp-socks）时返回 None。
+        """
+        try:
+            session = self._get_http_session(proxy_url)
+        except ValueError as exc:
+            return ProbeOutcome(ok=False, reason=f"代理地址无效: {exc}", quality="blocked")
+        if session is None:
+            return None
+        aiohttp = _get_aiohttp()
+        expectation = probe.expect
+        needs_html = expectation.needs_content or expectation.needs_title
+        headers = {"User-Agent": self._user_agent} if self._user_agent else None
+        # socks 代理由连接器处理，http 代理通过请求参数指定
+        request_proxy = None if proxy_url.startswith("socks") else proxy_url
+
+        start_time = time.perf_counter()
+        try:
+            async with session.get(
+                probe.url,
+                proxy=request_proxy,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=self._timeout_ms / 1000),
+            ) as response:
+                request_latency = int((time.perf_counter() - start_time) * 1000)
+                status = response.status
+                html_content = await response.text(errors="replace") if needs_html else ""
+        except asyncio.TimeoutError:
+            return ProbeOutcome(ok=False, reason="页面加载超时", quality="blocked")
+        except _http_errors(aiohttp) as exc:
+            return ProbeOutcome(ok=False, reason=f"HTTP错误: {exc}", quality="blocked")
+
+        document = HtmlDocument(html_content) if needs_html else None
+        ctx = MatchContext(
+            status=status,
+            title_lc=document.title().lower() if expectation.needs_title else "",
+            text_lc=document.text().lower() if expectation.needs_text else "",
+            document=document,
+        )
+        outcome = self._judge(probe, ctx)
+        outcome.request_latency_ms = request_latency
+        return outcome
+
+    def _get_http_session(self, proxy_url: str) -> Any:
+        """获取指定代理的 aiohttp 会话，依赖缺失时返回 None"""
+        session = self._http_sessions.get(proxy_url)
+        if session is not None and not session.closed:
+            return session
+        aiohttp = _get_aiohttp()
+        if aiohttp is None:
+            logging.warning("HTTP 拨测需要安装 aiohttp，改用浏览器拨测")
+            return None
+        if proxy_url.startswith("socks"):
+            aiohttp_socks = _get_aiohttp_socks()
+            if aiohttp_socks is None:
+                logging.warning("socks 代理的 HTTP 拨测需要安装 aiohttp-socks，改用浏览器拨测")
+                return None
+            connector = aiohttp_socks.ProxyConnector.from_url(
+                proxy_url,
+                limit=_HTTP_CONNECTION_LIMIT,
+                ttl_dns_cache=_HTTP_DNS_CACHE_TTL,
+                resolver=create_dns_resolver(aiohttp),
+            )
+        else:
+            connector = aiohttp.TCPConnector(
+                limit=_HTTP_CONNECTION_LIMIT,
+                ttl_dns_cache=_HTTP_DNS_CACHE_TTL,
+                resolver=create_dns_resolver(aiohttp),
+            )
+        session = aiohttp.ClientSession(connector=connector)
+        self._http_sessions[proxy_url] = session
+        return session
+
+    @staticmethod
+    def _request_latency_ms(response, start_time: float) -> int:
+        """纯网络请求延迟（到服务器响应首字节），取不到浏览器计时时退回到本地计时"""
+        if response is not None:
+            try:
+                response_start = response.request.timing["responseStart"]
+                if response_start >= 0:
+                    return int(response_start)
+            except Exception:
+                pass
+        return int((time.perf_counter() - start_time) * 1000)
+
+    async def _get_browser(self) -> Browser:
+        """获取共享的浏览器，不存在或已断开时启动新的"""
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+            if self._playwright is None:
+                self._playwright = await _get_playwright_api().async_playwright().start()
+            self._browser = await self._launch_browser(self._playwright)
+            return self._browser
+
+    async def _launch_browser(self, playwright: Playwright) -> Browser:
+        # 代理按 BrowserContext 设置，浏览器本身不绑定代理
         return await playwright.chromium.launch(
             headless=True,
-            proxy={"server": proxy_url},
             args=[
                 '--disable-gpu',  # 禁用GPU，避免GPU进程卡住
                 '--disable-dev-shm-usage',  # 避免共享内存问题
@@ -113,201 +358,193 @@ class PlaywrightProbe:
             ],
         )
 
-    async def _check_quality(self, probe: Probe, page, status: Optional[int]) -> ProbeOutcome:
+    async def _check_quality(self, probe: Probe, page, status: Optional[int], proxy_url: str) -> ProbeOutcome:
         """检查页面质量等级: optimal/suboptimal/blocked"""
         expectation = probe.expect
-        content = await page.content()
-        
-        title = await page.title()
-        text = self._extract_text(content)
+        if expectation.needs_document:
+            # 只解析一次 HTML，文本提取和选择器匹配共用同一棵树
+            title, html_content = await self._read_page(page, expectation.needs_title)
+            document = HtmlDocument(html_content)
+            text = document.text() if expectation.needs_text else ""
+        else:
+            # 没有选择器条件时无需传输整页 HTML，只在浏览器内提取标题和纯文本
+            document = None
+            title, text = await self._read_page_text(page, expectation.needs_title, expectation.needs_text)
+        # 标题和文本只转一次小写，匹配模式已在加载配置时转好；没有对应条件时跳过
+        ctx = MatchContext(status=status, title_lc=title.lower(), text_lc=text.lower(), document=document)
         
+        outcome = self._judge(probe, ctx)
+        if outcome.quality != "optimal":
+            outcome.screenshot_data = await self._save_screenshot(page, probe.name, outcome.quality, proxy_url)
+        return outcome
+
+    def _judge(self, probe: Probe, ctx: MatchContext) -> ProbeOutcome:
+        """按 must_not → expect → fallback_expect 的顺序判定质量等级"""
+        expectation = probe.expect
+        status = ctx.status
+
         # 1. 先检查 must_not（禁止特征）- 如果匹配则 blocked
-        if expectation.must_not:
-            match_result = self._match_dict(expectation.must_not, status, title, content, text)
+        if expectation.must_not_plan:
+            match_result = expectation.must_not_plan.match(ctx)
             if match_result.matched:
-                await self._save_screenshot(page, probe.name, "blocked")
                 logging.warning("%s 检测到禁止特征: %s", probe.name, match_result.reason)
                 return ProbeOutcome(ok=False, reason=match_result.reason, status=status, quality="blocked")
 
         # 2. 检查基本 expect（最优解）- 如果满足则 optimal
-        match_result = self._match_dict(expectation.to_dict(), status, title, content, text)
+        match_result = expectation.expect_plan.match(ctx)
         if match_result.matched:
             return ProbeOutcome(ok=True, reason="满足期望条件", status=status, quality="optimal")
         else:
-            logging.warning("%s 不满足期望条件: %s, dict:%s", probe.name, match_result.reason, f"{expectation.to_dict()}")
+            # 复用构造时生成的期望字典，交给 logging 按需格式化
+            logging.warning("%s 不满足期望条件: %s, dict:%s", probe.name, match_result.reason, expectation.expect_plan.raw)
 
         # 3. 检查 fallback_expect（次优解）- 如果满足则 suboptimal
-        if expectation.fallback_expect:
-            fallback_result = self._match_dict(expectation.fallback_expect, status, title, content, text)
+        if expectation.fallback_plan:
+            fallback_result = expectation.fallback_plan.match(ctx)
             if fallback_result.matched:
-                await self._save_screenshot(page, probe.name, "suboptimal")
                 logging.info("%s 满足次优解条件: %s", probe.name, fallback_result.reason)
                 return ProbeOutcome(ok=True, reason=fallback_result.reason, status=status, quality="suboptimal")
                     
         # 4. 都不满足，返回 blocked
-        await self._save_screenshot(page, probe.name, "blocked")
         return ProbeOutcome(ok=False, reason=match_result.reason, status=status, quality="blocked")
-     
-    
-    def _match_dict(self, config: dict, status: Optional[int], title: str, content: str, text: str) -> "MatchResult":
-        """
-        匹配字典配置
-        
-        支持的匹配方式：
-        - status: HTTP状态码
-        - title: 页面标题（字符串匹配）
-        - selector: CSS选择器 + 文本匹配（更精确）
-        - contains: 全文本包含（简单匹配）
-        """
-        # 检查状态码
-        matched_reasons = []
-        if "status" in config:
-            expected_statuses = config["status"] if isinstance(config["status"], list) else [config["status"]]
-            if status not in expected_statuses:
-                return MatchResult(matched=False, reason=f"状态码不匹配: 期望 {expected_statuses}, 实际 {status}")
-            matched_reasons.append(f"status: {status}")
-        # 检查标题
-        if "title" in config:
-            title_match = False
-            expected_titles = config["title"] if isinstance(config["title"], list) else [config["title"]]
-            for expected_title in expected_titles:
-                if expected_title.lower() in title.lower():
-                    title_match = True
-                    matched_reasons.append(f"title: {expected_title}")
-                    break
-            if not title_match:
-                return MatchResult(matched=False, reason=f"标题不匹配: 期望包含 {expected_titles}")
-        
-        # 检查 CSS 选择器匹配（精确查找）
-        if "selector" in config:
-            selector_match =  self._match_selector(content, config["selector"], config.get("text"))
-            if not selector_match.matched:
-                return selector_match
-            else:
-                matched_reasons.append(f"selector:{selector_match.reason}")
-        
-        # 检查全文本包含（简单匹配）
-        if "contains" in config:
-            contain_matched = False
-            expected_texts = config["contains"] if isinstance(config["contains"], list) else [config["contains"]]
-            for expected_text in expected_texts:
-                if expected_text.lower() in text.lower():
-                    matched_reasons.append(f"contains:{expected_text}")
-                    contain_matched = True
-                    break
-            if not contain_matched:
-                return MatchResult(matched=False, reason=f"文本不匹配: 期望包含 {expected_texts}") 
-        
-        # 如果没有任何检查项，认为不匹配
-        return MatchResult(matched=True, reason=';'.join(matched_reasons))
-    
-    def _match_selector(self, html_content: str, selector_config, text_pattern=None) -> "MatchResult":
+
+    @staticmethod
+    async def _read_page(page, needs_title: bool) -> Tuple[str, str]:
+        """读取页面 HTML，需要标题时合并为一次 evaluate 调用"""
+        if needs_title:
+            result = await page.evaluate(_READ_PAGE_SCRIPT)
+            return result["title"], result["html"]
+        return "", await page.content()
+
+    @staticmethod
+    async def _read_page_text(page, needs_title: bool, needs_text: bool) -> Tuple[str, str]:
+        """按需读取页面标题和纯文本，文本在浏览器内提取，只传回提取结果"""
+        if needs_text:
+            result = await page.evaluate(_READ_TEXT_SCRIPT)
+            return result["title"], result["text"]
+        if needs_title:
+            return await page.title(), ""
+        return "", ""
+
+    async def _save_screenshot(self, page, probe_name: str, quality: str, proxy_url: str) -> Optional[bytes]:
         """
-        使用 CSS 选择器进行精确匹配
-        
-        Args:
-            html_content: HTML内容
-            selector_config: 选择器配置，可以是字符串或字典
-            text_pattern: 可选的文本匹配模式
-        
-        Examples:
-            # 简单选择器
-            {"selector": ".error-message"}
-            
-            # 选择器 + 文本匹配
-            {"selector": ".error-message", "text": "Access Denied"}
-            
-            # 高级配置
-            {"selector": {"css": ".message", "text": "error", "attr": "class"}}
+        截取页面截图，文件在后台线程写入，不阻塞后续拨测
+
+        文件名包含代理地址：并行测试时同一探测点经由不同的测试入口同时拨测，各自写入不同的文件。
+        同一路径的写入按截图顺序依次执行，文件内容总是最后一次截图。
         """
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # 如果是字符串，直接作为CSS选择器
-            if isinstance(selector_config, str):
-                css_selector = selector_config
-                elements = soup.select(css_selector)
-                
-                if not elements:
-                    return MatchResult(matched=False, reason=f"未找到选择器: {css_selector}")
-                
-                # 如果指定了文本匹配
-                if text_pattern:
-                    patterns = text_pattern if isinstance(text_pattern, list) else [text_pattern]
-                    for element in elements:
-                        element_text = element.get_text(strip=True)
-                        for pattern in patterns:
-                            if pattern.lower() in element_text.lower():
-                                return MatchResult(matched=True, reason=f"选择器 {css_selector} 匹配文本: {pattern}")
-                    return MatchResult(matched=False, reason=f"选择器 {css_selector} 未找到文本: {patterns}")
-                
-                # 只要找到元素就算匹配
-                return MatchResult(matched=True, reason=f"找到选择器: {css_selector}")
-            
-            # 如果是字典，支持更高级的配置
-            elif isinstance(selector_config, dict):
-                css_selector = selector_config.get("css")
-                if not css_selector:
-                    return MatchResult(matched=False, reason="选择器配置缺少 css 字段")
-                
-                elements = soup.select(css_selector)
-                if not elements:
-                    return MatchResult(matched=False, reason=f"未找到选择器: {css_selector}")
-                
-                # 检查属性
-                if "attr" in selector_config:
-                    attr_name = selector_config["attr"]
-                    attr_value = selector_config.get("attr_value")
-                    for element in elements:
-                        if element.has_attr(attr_name):
-                            if attr_value is None or attr_value in element[attr_name]:
-                                return MatchResult(matched=True, reason=f"找到属性 {attr_name}")
-                    return MatchResult(matched=False, reason=f"未找到属性: {attr_name}")
-                
-                # 检查文本
-                if "text" in selector_config:
-                    patterns = selector_config["text"] if isinstance(selector_config["text"], list) else [selector_config["text"]]
-                    for element in elements:
-                        element_text = element.get_text(strip=True)
-                        for pattern in patterns:
-                            if pattern.lower() in element_text.lower():
-                                return MatchResult(matched=True, reason=f"选择器 {css_selector} 匹配文本: {pattern}")
-                    return MatchResult(matched=False, reason=f"选择器 {css_selector} 未找到文本: {patterns}")
-                
-                return MatchResult(matched=True, reason=f"找到选择器: {css_selector}")
-            
-            return MatchResult(matched=False, reason="无效的选择器配置")
-            
+            data = await page.screenshot()
+        except Exception:
+            return None
+        path = Path("screenshots") / f"{probe_name}-{quality}-{_proxy_label(proxy_url)}.png"
+        task = asyncio.create_task(self._write_after(self._last_write.get(path), path, data))
+        self._last_write[path] = task
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+        task.add_done_callback(lambda done: self._forget_write(path, done))
+        return data
+
+    def _forget_write(self, path: Path, task: asyncio.Task) -> None:
+        if self._last_write.get(path) is task:
+            del self._last_write[path]
+
+    @staticmethod
+    async def _write_after(previous: Optional[asyncio.Task], path: Path, data: bytes) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await asyncio.to_thread(_write_screenshot, path, data)
+
+
+def _proxy_label(proxy_url: str) -> str:
+    """代理地址转为可用于文件名的标识，如 socks5://127.0.0.1:7891 → 127.0.0.1_7891"""
+    parsed = urlparse(proxy_url)
+    label = f"{parsed.hostname}_{parsed.port}" if parsed.hostname else proxy_url
+    return re.sub(r"[^\w.-]", "_", label)
+
+
+def _write_screenshot(path: Path, data: bytes) -> None:
+    try:
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(data)
+    except OSError as exc:
+        logging.debug("保存截图失败 (%s): %s", path, exc)
+
+
+class HtmlDocument:
+    """
+    已解析的 HTML 文档
+
+    优先使用 selectolax，否则使用 BeautifulSoup；对匹配器提供统一的
+    select / element_text / element_attr / text 接口。
+    """
+
+    __slots__ = ("_doc",)
+
+    def __init__(self, html_content: str) -> None:
+        if LexborHTMLParser is not None:
+            self._doc = LexborHTMLParser(html_content)
+            return
+        bs4 = _get_bs4()
+        try:
+            self._doc = bs4.BeautifulSoup(html_content, _HTML_PARSER)
         except Exception as exc:
-            logging.warning("选择器匹配失败: %s", exc)
-            return MatchResult(matched=False, reason=f"选择器匹配异常: {exc}")
-    
-    def _extract_text(self, html_content: str) -> str:
-        """使用 BeautifulSoup 提取页面纯文本内容"""
+            logging.warning("解析 HTML 失败: %s", exc)
+            self._doc = bs4.BeautifulSoup("", "html.parser")
+
+    def select(self, css_selector: str, compile_css: Optional[Callable[[], Any]] = None) -> list:
+        """查找选择器命中的元素，BeautifulSoup 下优先使用匹配器缓存的预编译选择器"""
+        if LexborHTMLParser is not None:
+            return self._doc.css(css_selector)
+        compiled = compile_css() if compile_css is not None else None
+        if compiled is not None:
+            return compiled.select(self._doc)
+        return self._doc.select(css_selector)
+
+    def title(self) -> str:
+        """页面标题（与 document.title 一样合并空白）"""
+        if LexborHTMLParser is not None:
+            node = self._doc.css_first("title")
+            text = node.text() if node is not None else ""
+        else:
+            text = self._doc.title.get_text() if self._doc.title is not None else ""
+        return ' '.join(text.split())
+
+    def text(self) -> str:
+        """提取页面纯文本内容（跳过 script/style，不修改文档树）"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            # 移除 script 和 style 标签
-            for script in soup(["script", "style"]):
-                script.decompose()
-            # 获取纯文本并去除多余空白
-            text = soup.get_text(separator=' ', strip=True)
-            return ' '.join(text.split())
+            if LexborHTMLParser is not None:
+                # 在副本上移除 script/style，原文档树留给选择器匹配
+                tree = self._doc.clone()
+                tree.strip_tags(list(_NON_TEXT_TAGS))
+                text = tree.root.text(separator=' ') if tree.root is not None else ""
+                return ' '.join(text.split())
+            # 只收集普通文本节点，注释、doctype 等子类型不计入
+            navigable_string = _get_bs4().NavigableString
+            parts = [
+                str(node) for node in self._doc.descendants
+                if type(node) is navigable_string and node.parent.name not in _NON_TEXT_TAGS
+            ]
+            # 去除多余空白
+            return ' '.join(' '.join(parts).split())
         except Exception as exc:
             logging.warning("提取文本失败: %s", exc)
             return ""
-    
-    async def _save_screenshot(self, page, probe_name: str, quality: str) -> None:
-        """保存截图"""
-        try:
-            Path("screenshots").mkdir(exist_ok=True)
-            await page.screenshot(path=f"screenshots/{probe_name}-{quality}.png")
-        except Exception:
-            pass
-
 
-@dataclass
-class MatchResult:
-    """匹配结果"""
-    matched: bool
-    reason: str
+    @staticmethod
+    def element_text(element: Any) -> str:
+        """元素文本（去除各文本节点首尾空白后拼接）"""
+        if LexborHTMLParser is not None:
+            return element.text(strip=True)
+        return element.get_text(strip=True)
 
+    @staticmethod
+    def element_attr(element: Any, name: str) -> Any:
+        """元素属性值，不存在时返回 None；class 与 BeautifulSoup 一致按空白拆成列表"""
+        if LexborHTMLParser is None:
+            return element[name] if element.has_attr(name) else None
+        attributes = element.attributes
+        if name not in attributes:
+            return None
+        value = attributes[name] or ""
+        return value.split() if name == "class" else value
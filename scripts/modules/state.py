@@ -2,45 +2,66 @@
 
 from __future__ import annotations
 
-import json
 import logging
+import os
+import time
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Optional
 
+from . import jsonio
 
-@dataclass
+
+@dataclass(slots=True)
 class ProbeState:
     """单个探测点的状态"""
     probe_name: str
     quality: str  # optimal/suboptimal/blocked
     outbound: Optional[str] = None
-    last_check_time: Optional[str] = None  # ISO format timestamp
+    last_check_time: Optional[float] = None  # Unix 时间戳（秒）
     reason: Optional[str] = None
 
 
 class StateManager:
-    """状态管理器，用于记录和查询探测状态"""
+    """
+    状态管理器，用于记录和查询探测状态
+
+    update() 只修改内存中的状态，调用 flush()（或退出 with 块）时才写入文件。
+    """
     def __init__(self, state_file: Path) -> None:
         self._state_file = state_file
         self._states: Dict[str, ProbeState] = {}
+        self._dirty = False
         self._load()
+
+    def __enter__(self) -> "StateManager":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.flush()
     
     def _load(self) -> None:
         """从文件加载状态"""
         if not self._state_file.exists():
             return
         try:
-            data = json.loads(self._state_file.read_text(encoding="utf-8"))
+            data = jsonio.loads(self._state_file.read_bytes())
             for name, state_dict in data.items():
-                self._states[name] = ProbeState(**state_dict)
+                state = ProbeState(**state_dict)
+                # 兼容旧版本保存的 ISO 格式时间
+                if isinstance(state.last_check_time, str):
+                    try:
+                        state.last_check_time = datetime.fromisoformat(state.last_check_time).timestamp()
+                    except ValueError:
+                        state.last_check_time = None
+                self._states[name] = state
             logging.debug("已加载 %d 个探测点状态", len(self._states))
         except Exception as exc:
             logging.warning("状态文件加载失败: %s", exc)
     
     def save(self) -> None:
-        """保存状态到文件"""
+        """保存状态到文件（先写临时文件再替换，避免写入中断导致文件损坏）"""
         try:
             self._state_file.parent.mkdir(parents=True, exist_ok=True)
             data = {name: {
@@ -50,10 +71,18 @@ class StateManager:
                 "last_check_time": state.last_check_time,
                 "reason": state.reason,
             } for name, state in self._states.items()}
-            self._state_file.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp_file = self._state_file.with_suffix(self._state_file.suffix + ".tmp")
+            tmp_file.write_bytes(jsonio.dumps(data, indent=True))
+            os.replace(tmp_file, self._state_file)
+            self._dirty = False
             logging.debug("已保存 %d 个探测点状态", len(self._states))
         except Exception as exc:
             logging.error("状态文件保存失败: %s", exc)
+
+    def flush(self) -> None:
+        """有未保存的更新时写入文件"""
+        if self._dirty:
+            self.save()
     
     def update(self, probe_name: str, quality: str, outbound: Optional[str] = None, reason: Optional[str] = None) -> None:
         """更新探测点状态"""
@@ -61,10 +90,10 @@ class StateManager:
             probe_name=probe_name,
             quality=quality,
             outbound=outbound,
-            last_check_time=datetime.now().isoformat(),
+            last_check_time=time.time(),
             reason=reason,
         )
-        self.save()
+        self._dirty = True
     
     def get(self, probe_name: str) -> Optional[ProbeState]:
         """获取探测点状态"""
@@ -80,9 +109,7 @@ class StateManager:
             return False
         
         try:
-            last_check = datetime.fromisoformat(state.last_check_time)
-            elapsed = datetime.now() - last_check
-            hours_elapsed = elapsed.total_seconds() / 3600
+            hours_elapsed = (time.time() - state.last_check_time) / 3600
             
             if hours_elapsed < skip_hours:
                 logging.info("%s 次优解距上次探测 %.1f 小时，跳过本次探测", probe_name, hours_elapsed)
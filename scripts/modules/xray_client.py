@@ -1,69 +1,201 @@
-"""Xray API client for routing rule management"""
+"""Xray API client for routing rule and outbound management"""
 
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
-import subprocess
-import tempfile
-from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Sequence
 
+from . import jsonio
 from .config import XraySettings
 
+# 可选：直接调用 Xray gRPC API，省去每次 fork xray 进程；导入耗时较长，首次删除规则时才导入
+_grpc = None
+
+# 删除类请求都只有一个 string 字段(1)：RemoveRule 的 ruleTag、RemoveOutbound 的 tag
+_REMOVE_RULE_METHOD = "/xray.app.router.command.RoutingService/RemoveRule"
+_REMOVE_OUTBOUND_METHOD = "/xray.app.proxyman.command.HandlerService/RemoveOutbound"
+_GRPC_TIMEOUT = 10.0
+# 调用方被取消时等待已启动的 xray 子进程结束的最长时间，超时后强制结束
+_CANCEL_WAIT_TIMEOUT = 10.0
+
 
 class XrayAPIError(RuntimeError):
     pass
 
 
 class XrayAPIClient:
+    """
+    Xray API 客户端
+
+    所有调用均为协程，xray 子进程和 gRPC 请求都不会阻塞事件循环。推荐用法：
+
+        async with XrayAPIClient(settings) as client:
+            await client.add_routing_rule(rule)
+    """
+
     def __init__(self, settings: XraySettings, dry_run: bool = False) -> None:
         self._settings = settings
         self._dry_run = dry_run
+        self._cmd_prefix = (settings.exe, "api")
+        self._channel = None
+        # gRPC 方法名 → 可调用对象，与连接一同复用
+        self._grpc_methods: Dict[str, Any] = {}
+
+    async def __aenter__(self) -> "XrayAPIClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """关闭复用的 gRPC 连接"""
+        channel, self._channel = self._channel, None
+        self._grpc_methods.clear()
+        if channel is not None:
+            await channel.close()
 
-    def remove_routing_rule(self, tag: str) -> None:
-        if not tag:
+    async def remove_routing_rule(self, tag: str) -> None:
+        await self.remove_routing_rules([tag])
+
+    async def remove_routing_rules(self, tags: Sequence[str]) -> None:
+        """一次 rmrules 调用删除多条路由规则"""
+        tags = [tag for tag in tags if tag]
+        if not tags:
+            return
+        if not self._dry_run and _get_grpc() is not None:
+            await self._grpc_remove(_REMOVE_RULE_METHOD, tags, "规则")
             return
-        self._run("rmrules", f"--server={self._settings.api}", tag)
+        await self._run("rmrules", f"--server={self._settings.api}", *tags)
 
-    def add_routing_rule(self, rule: Dict[str, Any]) -> None:
+    async def add_routing_rule(self, rule: Dict[str, Any]) -> None:
+        await self.add_routing_rules([rule])
+
+    async def add_routing_rules(self, rules: Sequence[Dict[str, Any]]) -> None:
+        """一次 adrules 调用追加多条路由规则"""
+        if not rules:
+            return
         config_template = {
             'routing': {
-                'rules': [rule]
+                'rules': list(rules)
             }
         }
-        temp_file = tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".json", delete=False)
-        try:
-            json.dump(config_template, temp_file, ensure_ascii=False)
-            temp_file.flush()
-            temp_path = Path(temp_file.name)
-        finally:
-            temp_file.close()
+        # 规则 JSON 通过 stdin 传给 xray，无需落盘临时文件
+        await self._run(
+            "adrules",
+            f"--server={self._settings.api}",
+            "--append",
+            "stdin:",
+            stdin_data=jsonio.dumps(config_template),
+        )
 
-        try:
-            self._run(
-                "adrules",
-                f"--server={self._settings.api}",
-                "--append",
-                str(temp_path)
-            )
-        finally:
+    async def add_outbound(self, outbound: Dict[str, Any]) -> None:
+        await self.add_outbounds([outbound])
+
+    async def add_outbounds(self, outbounds: Sequence[Dict[str, Any]]) -> None:
+        """一次 ado 调用添加多个 outbound（xray 配置中 outbounds 数组的项）"""
+        if not outbounds:
+            return
+        # AddOutbound 的请求需要 xray 把 JSON 编译为 protobuf，只能经由命令行完成
+        await self._run(
+            "ado",
+            f"--server={self._settings.api}",
+            "stdin:",
+            stdin_data=jsonio.dumps({'outbounds': list(outbounds)}),
+        )
+
+    async def remove_outbound(self, tag: str) -> None:
+        await self.remove_outbounds([tag])
+
+    async def remove_outbounds(self, tags: Sequence[str]) -> None:
+        """按 tag 删除 outbound"""
+        tags = [tag for tag in tags if tag]
+        if not tags:
+            return
+        if not self._dry_run and _get_grpc() is not None:
+            await self._grpc_remove(_REMOVE_OUTBOUND_METHOD, tags, "outbound")
+            return
+        await self._run("rmo", f"--server={self._settings.api}", *tags)
+
+    async def _grpc_remove(self, method: str, tags: Sequence[str], kind: str) -> None:
+        """通过 gRPC 逐个删除规则或 outbound，连接在整个客户端生命周期内复用"""
+        grpc = _get_grpc()
+        if self._channel is None:
+            self._channel = grpc.aio.insecure_channel(self._settings.api)
+        call = self._grpc_methods.get(method)
+        if call is None:
+            # 请求按 protobuf 线格式手工编码，响应为空消息，无需生成 stub
+            call = self._grpc_methods[method] = self._channel.unary_unary(method)
+        # 某一项不存在时继续删除其余项，最后再报告第一个错误
+        first_error = None
+        for tag in tags:
+            logging.debug("gRPC 删除%s: %s", kind, tag)
             try:
-                Path(temp_path).unlink()
-            except FileNotFoundError:
-                pass
+                await call(_encode_string_field(1, tag), timeout=_GRPC_TIMEOUT)
+            except grpc.RpcError as exc:
+                logging.error("xray gRPC 删除%s %s 失败: %s", kind, tag, exc.details())
+                first_error = first_error or exc
+        if first_error is not None:
+            raise XrayAPIError(first_error.details() or str(first_error)) from first_error
 
-    def _run(self, *args: str) -> None:
-        cmd = [self._settings.exe, "api", *args]
-        logging.debug("执行 xray 命令: %s", " ".join(cmd))
+    async def _run(self, *args: str, stdin_data: Optional[bytes] = None) -> None:
+        cmd = (*self._cmd_prefix, *args)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("执行 xray 命令: %s", " ".join(cmd))
         if self._dry_run:
             logging.info("dry-run: %s", " ".join(cmd))
             return
 
-        completed = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        if completed.returncode != 0:
-            logging.error("xray 命令失败: %s", completed.stderr.strip())
-            raise XrayAPIError(completed.stderr.strip())
-        if completed.stdout.strip():
-            logging.debug("xray 输出: %s", completed.stdout.strip())
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if stdin_data is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        communicate = asyncio.ensure_future(process.communicate(stdin_data))
+        try:
+            stdout, stderr = await asyncio.shield(communicate)
+        except asyncio.CancelledError:
+            # 子进程的请求可能已经发出（如规则已添加），等它结束后再传播取消，
+            # 调用方在取消后执行的清理才能覆盖这次调用的结果
+            try:
+                await asyncio.wait_for(communicate, _CANCEL_WAIT_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+            raise
+        if process.returncode != 0:
+            error = stderr.decode(errors="replace").strip()
+            logging.error("xray 命令失败: %s", error)
+            raise XrayAPIError(error)
+        output = stdout.decode(errors="replace").strip()
+        if output:
+            logging.debug("xray 输出: %s", output)
+
+
+def _get_grpc():
+    """返回 grpc 模块，未安装时返回 None"""
+    global _grpc
+    if _grpc is None:
+        try:
+            import grpc as _grpc
+            import grpc.aio  # noqa: F401
+        except ImportError:
+            _grpc = False
+    return _grpc or None
+
+
+def _encode_string_field(field_number: int, value: str) -> bytes:
+    """把单个 string 字段编码为 protobuf 线格式（wire type 2）"""
+    data = value.encode("utf-8")
+    return _encode_varint(field_number << 3 | 2) + _encode_varint(len(data)) + data
+
 
+def _encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
@@ -5,12 +5,16 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
+import signal
 import sys
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Optional, Sequence
-from urllib.parse import urlparse
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
 
 from modules import (
     AppConfig,
@@ -21,11 +25,17 @@ from modules import (
     ProbeOutcome,
     StateManager,
     TelegramNotifier,
+    TestSlot,
     XrayAPIClient,
     XrayAPIError,
     should_send_alert,
 )
 
+try:
+    import uvloop  # 可选：基于 libuv 的事件循环，调度和 socket I/O 更快
+except ImportError:
+    uvloop = None
+
 
 class ProbeManager:
     def __init__(self, config: AppConfig, xray_test_client: XrayAPIClient, xray_prod_client: XrayAPIClient, timeout_ms: int) -> None:
@@ -35,15 +45,41 @@ class ProbeManager:
         self._playwright = PlaywrightProbe(timeout_ms=timeout_ms, user_agent=config.user_agent)
         self._telegram = TelegramNotifier(config.telegram)
         self._state = StateManager(Path(config.state_file).expanduser().resolve())
+        # 所有探测点共用测试入口，同一时间只能有一组测试规则：域名规则会相互覆盖
+        # （domain:example.com 也匹配 www.example.com），自定义 rules 甚至可以不按域名匹配
+        self._test_lock = asyncio.Lock()
+        # 配置了多组测试入口时按入口分配：各探测点从空闲队列领取入口，用完删除测试规则后归还
+        self._free_slots: asyncio.Queue = asyncio.Queue()
+        for slot in config.proxy.test_slots:
+            self._free_slots.put_nowait(slot)
 
     async def run(self) -> None:
         if self._config.user_agent:
             logging.info("使用自定义 User-Agent: %s", self._config.user_agent)
         
-        for probe in self._config.probes:
+        # 整个运行期间复用浏览器和 Telegram 连接，结束时统一写入状态文件
+        async with self._playwright, self._telegram:
+            with self._state:
+                # 各探测点互不依赖，并发拨测；信号量限制同时占用代理的拨测数量
+                semaphore = asyncio.Semaphore(max(1, self._config.probe_concurrency))
+                results = await asyncio.gather(
+                    *(self._check_one(probe, semaphore) for probe in self._config.probes),
+                    return_exceptions=True,
+                )
+
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for probe, result in zip(self._config.probes, results):
+            if isinstance(result, BaseException):
+                logging.error("%s 拨测异常: %s", probe.name, result)
+        if errors:
+            raise errors[0]
+
+    async def _check_one(self, probe: Probe, semaphore: asyncio.Semaphore) -> None:
+        """拨测单个探测点并按质量等级处理"""
+        async with semaphore:
             logging.info("开始拨测: %s", probe.name)
             outcome = await self._playwright.check(probe, self._config.proxy.prod)
-            
+
             if outcome.quality == "optimal":
                 await self._handle_optimal(probe, outcome)
             elif outcome.quality == "suboptimal":
@@ -128,83 +164,192 @@ class ProbeManager:
 
         test_tag = f"probe-{probe.name}-test"
         prod_tag = f"probe-{probe.name}-prod"
-        domain = extract_domain(probe.url)
-        rule_template = {
+        domain = probe.domain
+        # 如果 probe 配置了自定义 rules，合并到模板中；模板只读，各规则通过字典展开复制
+        if probe.rules and logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("使用 probe %s 的自定义 rules: %s", probe.name, probe.rules)
+        rule_template = MappingProxyType({
             "type": "field",
-            "domain": [f"domain:{domain}"]
-        }
+            "domain": [f"domain:{domain}"],
+            **(probe.rules or {}),
+        })
+
+        best_optimal, best_suboptimal = await self._test_candidates(
+            probe, candidates, test_tag, rule_template, accept_suboptimal
+        )
         
-        # 如果 probe 配置了自定义 rules，合并到模板中
-        if probe.rules:
-            logging.debug("使用 probe %s 的自定义 rules: %s", probe.name, probe.rules)
-            rule_template.update(probe.rules)
+        # 优先使用最优解，其次使用次优解（如果接受的话）
+        selected = best_optimal or (best_suboptimal if accept_suboptimal else None)
+        if selected:
+            quality_desc = "最优解" if selected == best_optimal else "次优解"
+            logging.info("选择出站 %s (%s) 切换生产", selected, quality_desc)
+            # 生产规则不限定入口
+            rule_prod = {key: value for key, value in rule_template.items() if key != "inboundTag"}
+            await self._promote_outbound(prod_tag, rule_prod, selected)
+            return selected
+        
+        return None
 
-        # 记录找到的最优解和次优解
-        best_optimal = None
-        best_suboptimal = None
+    async def _test_candidates(
+        self,
+        probe: Probe,
+        candidates: Sequence[str],
+        test_tag: str,
+        rule_template: Mapping[str, Any],
+        accept_suboptimal: bool,
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """通过测试规则验证候选出站，返回 (最优解, 次优解)"""
+        slots = self._config.proxy.test_slots
+        if len(slots) >= 2:
+            return await self._test_candidates_hedged(
+                probe, candidates, test_tag, rule_template, accept_suboptimal, slots
+            )
+
+        async with self._test_lock:
+            # 记录找到的最优解和次优解
+            best_optimal = None
+            best_suboptimal = None
+
+            for outbound in candidates:
+                logging.info("尝试候选出站 %s", outbound)
+                try:
+                    await self._xray_test.remove_routing_rule(test_tag)
+                except XrayAPIError:
+                    logging.debug("测试规则 %s 不存在, 忽略", test_tag)
+
+                test_rule = {**rule_template, "ruleTag": test_tag, "outboundTag": outbound}
+                try:
+                    await self._xray_test.add_routing_rule(test_rule)
+                except XrayAPIError as exc:
+                    logging.error("添加测试规则失败 (%s): %s", outbound, exc)
+                    continue
+
+                outcome = await self._playwright.check(probe, self._config.proxy.test)
+            
+                if outcome.quality == "optimal":
+                    logging.info("✅ 找到最优解: %s", outbound)
+                    best_optimal = outbound
+                    # 找到最优解立即使用
+                    break
+                elif outcome.quality == "suboptimal" and accept_suboptimal and not best_suboptimal:
+                    logging.info("⚠️  找到次优解: %s ", outbound)
+                    best_suboptimal = outbound
+                    # 继续寻找是否有更好的最优解
+                else:
+                    logging.warning("❌ 候选出站 %s 测试结果: %s - %s", outbound, outcome.quality, outcome.reason)
+
+            # 清理测试规则
+            try:
+                await self._xray_test.remove_routing_rule(test_tag)
+            except XrayAPIError:
+                logging.debug("测试规则清理失败, 可能不存在")
+
+            return best_optimal, best_suboptimal
+
+    async def _test_candidates_hedged(
+        self,
+        probe: Probe,
+        candidates: Sequence[str],
+        test_tag: str,
+        rule_template: Mapping[str, Any],
+        accept_suboptimal: bool,
+        slots: Sequence[TestSlot],
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        按测试入口数量分批并行验证候选出站，返回 (最优解, 次优解)
 
-        for outbound in candidates:
-            logging.info("尝试候选出站 %s", outbound)
+        每个候选从所有探测点共用的空闲队列领取一个测试入口（独立的代理地址和 inbound），
+        批内任一候选达到最优解时取消其余拨测；次优解取批内优先级最高的一个。
+        """
+        slot_tags = [f"{test_tag}-{slot.inbound}" for slot in slots]
+        best_suboptimal = None
+        try:
+            for start in range(0, len(candidates), len(slots)):
+                batch = candidates[start:start + len(slots)]
+                tasks = [
+                    asyncio.create_task(self._test_candidate(probe, outbound, test_tag, rule_template))
+                    for outbound in batch
+                ]
+                qualities: Dict[str, str] = {}
+                try:
+                    for next_done in asyncio.as_completed(tasks):
+                        outbound, outcome = await next_done
+                        if outcome is None:
+                            continue
+                        if outcome.quality == "optimal":
+                            logging.info("✅ 找到最优解: %s", outbound)
+                            return outbound, best_suboptimal
+                        qualities[outbound] = outcome.quality
+                        if outcome.quality != "suboptimal" or not accept_suboptimal:
+                            logging.warning("❌ 候选出站 %s 测试结果: %s - %s", outbound, outcome.quality, outcome.reason)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+
+                if accept_suboptimal and not best_suboptimal:
+                    best_suboptimal = next((outbound for outbound in batch if qualities.get(outbound) == "suboptimal"), None)
+                    if best_suboptimal:
+                        logging.info("⚠️  找到次优解: %s ", best_suboptimal)
+            return None, best_suboptimal
+        finally:
+            # 兜底清理：取消时可能来不及删除规则；tag 含探测点名称，不影响其他探测点
             try:
-                self._xray_test.remove_routing_rule(test_tag)
+                await self._xray_test.remove_routing_rules(slot_tags)
             except XrayAPIError:
-                logging.debug("测试规则 %s 不存在, 忽略", test_tag)
+                logging.debug("测试规则清理失败, 可能不存在")
+
+    async def _test_candidate(
+        self,
+        probe: Probe,
+        outbound: str,
+        test_tag: str,
+        rule_template: Mapping[str, Any],
+    ) -> Tuple[str, Optional[ProbeOutcome]]:
+        """领取一个空闲测试入口验证单个候选出站，添加测试规则失败时结果为 None"""
+        slot = await self._free_slots.get()
+        slot_tag = f"{test_tag}-{slot.inbound}"
+        try:
+            logging.info("尝试候选出站 %s (测试入口 %s)", outbound, slot.inbound)
+            await self._remove_test_rule(slot_tag)
 
-            test_rule = dict(rule_template)
-            test_rule.update({"ruleTag": test_tag, "outboundTag": outbound})
+            test_rule = {**rule_template, "inboundTag": [slot.inbound], "ruleTag": slot_tag, "outboundTag": outbound}
             try:
-                self._xray_test.add_routing_rule(test_rule)
+                await self._xray_test.add_routing_rule(test_rule)
             except XrayAPIError as exc:
                 logging.error("添加测试规则失败 (%s): %s", outbound, exc)
-                continue
+                return outbound, None
 
-            outcome = await self._playwright.check(probe, self._config.proxy.test)
-            
-            if outcome.quality == "optimal":
-                logging.info("✅ 找到最优解: %s", outbound)
-                best_optimal = outbound
-                # 找到最优解立即使用
-                break
-            elif outcome.quality == "suboptimal" and accept_suboptimal and not best_suboptimal:
-                logging.info("⚠️  找到次优解: %s ", outbound)
-                best_suboptimal = outbound
-                # 继续寻找是否有更好的最优解
-            else:
-                logging.warning("❌ 候选出站 %s 测试结果: %s - %s", outbound, outcome.quality, outcome.reason)
+            return outbound, await self._playwright.check(probe, slot.proxy)
+        finally:
+            # 删除测试规则后才归还入口，本任务被取消时也等删除完成，
+            # 下一个领取该入口的探测点不会命中本规则
+            cleanup = asyncio.ensure_future(self._remove_test_rule(slot_tag))
+            cleanup.add_done_callback(lambda _: self._free_slots.put_nowait(slot))
+            await asyncio.shield(cleanup)
 
-        # 清理测试规则
+    async def _remove_test_rule(self, test_tag: str) -> None:
         try:
-            self._xray_test.remove_routing_rule(test_tag)
+            await self._xray_test.remove_routing_rule(test_tag)
         except XrayAPIError:
-            logging.debug("测试规则清理失败, 可能不存在")
-        
-        # 优先使用最优解，其次使用次优解（如果接受的话）
-        selected = best_optimal or (best_suboptimal if accept_suboptimal else None)
-        if selected:
-            quality_desc = "最优解" if selected == best_optimal else "次优解"
-            logging.info("选择出站 %s (%s) 切换生产", selected, quality_desc)
-            rule_prod = {}
-            rule_prod.update(rule_template)
-            rule_prod.pop("inboundTag", None)
-            self._promote_outbound(prod_tag, rule_prod, selected)
-            return selected
-        
-        return None
+            logging.debug("测试规则 %s 不存在, 忽略", test_tag)
 
-    def _promote_outbound(self, prod_tag: str, rule_template: Dict[str, Any], outbound: str) -> None:
+    async def _promote_outbound(self, prod_tag: str, rule_template: Mapping[str, Any], outbound: str) -> None:
         try:
-            self._xray_prod.remove_routing_rule(prod_tag)
+            await self._xray_prod.remove_routing_rule(prod_tag)
             logging.info("已删除旧生产规则: %s", prod_tag)
         except XrayAPIError:
             logging.info("生产规则 %s 不存在, 直接添加", prod_tag)  
 
-        new_rule = dict(rule_template)
-        new_rule.update({"tag": prod_tag, "outboundTag": outbound})
-        self._xray_prod.add_routing_rule(new_rule)
+        new_rule = {**rule_template, "tag": prod_tag, "outboundTag": outbound}
+        await self._xray_prod.add_routing_rule(new_rule)
         logging.info("已添加生产规则 %s -> %s", prod_tag, outbound)
 
     async def _send_quality_alert(self, probe: Probe, outcome: ProbeOutcome) -> None:
         """发送次优解告警到 Telegram"""
+        # 未启用通知时不必拼接消息
+        if not self._telegram.enabled:
+            return
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         message = (
@@ -221,6 +366,9 @@ class ProbeManager:
 
     async def _send_outbound_change_alert(self, probe: Probe, new_outbound: Optional[str], success: bool, from_suboptimal: bool = False) -> None:
         """发送出站切换告警到 Telegram"""
+        # 未启用通知时不必拼接消息
+        if not self._telegram.enabled:
+            return
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         if success and new_outbound:
@@ -256,22 +404,19 @@ class ProbeManager:
         await self._telegram.send_alert(message)
 
 
-def extract_domain(url: str) -> str:
-    parsed = urlparse(url)
-    host = parsed.hostname
-    if not host:
-        raise ConfigError(f"URL 无法解析域名: {url}")
-    return host
-
-
 def setup_logging(log_file: Path, verbose: bool) -> None:
     log_file.parent.mkdir(parents=True, exist_ok=True)
     handlers = [logging.FileHandler(log_file, encoding="utf-8"), logging.StreamHandler(sys.stdout)]
+    # 事件循环线程只把日志记录放入内存队列，由后台线程写文件和终端，避免磁盘 I/O 阻塞拨测
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
     level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(
         level=level,
         format="%(asctime)s %(levelname)s %(message)s",
-        handlers=handlers,
+        handlers=[logging.handlers.QueueHandler(log_queue)],
     )
 
 
@@ -295,14 +440,23 @@ async def async_main(args: argparse.Namespace) -> None:
     logging.info("生产 Xray API: %s", config.xray_prod.api)
     
     manager = ProbeManager(config, xray_test_client, xray_prod_client, timeout_ms=args.timeout)
-    await manager.run()
+    # SIGTERM 时取消主任务，让 finally / with 块照常执行，已更新的状态仍会写入文件
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    try:
+        await manager.run()
+    finally:
+        await asyncio.gather(xray_test_client.close(), xray_prod_client.close())
 
 
 def main(argv: Optional[Sequence[str]] = None) -> int:
     args = parse_args(argv)
     setup_logging(Path(args.log_file).expanduser().resolve(), verbose=args.verbose)
     try:
-        asyncio.run(async_main(args))
+        run = uvloop.run if uvloop is not None else asyncio.run
+        run(async_main(args))
     except ConfigError as exc:
         logging.error("配置错误: %s", exc)
         return 2
@@ -312,6 +466,9 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
     except KeyboardInterrupt:
         logging.warning("用户中断")
         return 1
+    except asyncio.CancelledError:
+        logging.warning("收到终止信号，已保存状态后退出")
+        return 1
     return 0
 
 
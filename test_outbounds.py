@@ -1,19 +1,27 @@
 #!/usr/bin/env python3
 
 import asyncio
-import json
 import logging
 import time
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
+from types import MappingProxyType
+from typing import Any, BinaryIO, Dict, List, Mapping, Optional, Set, Tuple
+from uuid import uuid4
 
-from scripts.modules.config import ConfigLoader, Expectation, Probe, XraySettings
+from scripts.modules import jsonio
+from scripts.modules.config import ConfigLoader, Expectation, Probe, TestSlot, XraySettings
 from scripts.modules.probe import PlaywrightProbe
 from scripts.modules.xray_client import XrayAPIClient, XrayAPIError
 
+try:
+    import uvloop  # 可选：基于 libuv 的事件循环，调度和 socket I/O 更快
+except ImportError:
+    uvloop = None
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class TestResult:
     outbound: str
     address: str
@@ -37,85 +45,144 @@ class TestResult:
         }
 
 
+def load_outbounds_config(path: Path) -> Dict[str, Any]:
+    """加载待测试 outbound 配置；文件未修改时复用上次解析的结果，调用方不应修改返回值"""
+    stat = path.stat()
+    return _load_outbounds_cached(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=4)
+def _load_outbounds_cached(path: Path, mtime_ns: int, size: int) -> Dict[str, Any]:
+    return jsonio.loads(path.read_bytes())
+
+
+@dataclass(slots=True)
+class _OutboundStats:
+    """单个 outbound 的汇总统计，随每条结果增量更新"""
+    address: str
+    optimal: int = 0
+    suboptimal: int = 0
+    blocked: int = 0
+    success: int = 0
+    total_request_latency_ms: int = 0
+    total_latency_ms: int = 0
+
+    def add(self, result: TestResult) -> None:
+        if result.quality == 'optimal':
+            self.optimal += 1
+        elif result.quality == 'suboptimal':
+            self.suboptimal += 1
+        elif result.quality == 'blocked':
+            self.blocked += 1
+        # 平均延迟只统计成功的结果
+        if result.success:
+            self.success += 1
+            self.total_request_latency_ms += result.request_latency_ms
+            self.total_latency_ms += result.latency_ms
+
+
+def _write_lines(stream: BinaryIO, lines: List[bytes]) -> None:
+    stream.writelines(lines)
+    stream.flush()
+
+
 class OutboundTester:
     def __init__(self, config_path: str, outbounds_config_path: str, output_file: str = "test_results.json"):
         self.config = ConfigLoader.load(Path(config_path))
-        with open(outbounds_config_path, 'r', encoding='utf-8') as f:
-            self.outbounds_config = json.load(f)
+        self.outbounds_config = load_outbounds_config(Path(outbounds_config_path))
         # 使用测试环境的 xray 配置
         self.xray = XrayAPIClient(self.config.xray_test)
         self.playwright = PlaywrightProbe(timeout_ms=30000, user_agent=self.config.user_agent)
         self.results: List[TestResult] = []
+        # outbound → 汇总统计，按 outbound 开始测试的顺序排列
+        self._stats: Dict[str, _OutboundStats] = {}
         self.output_file = output_file
+        # 每条结果产生后立即追加到 NDJSON 文件，测试中断时已完成的结果不会丢失
+        self.stream_file = f"{output_file}.ndjson"
+        self._stream: Optional[BinaryIO] = None
+        # 待写入 NDJSON 文件的行，每个 outbound 测试完成后在线程中统一写入
+        self._stream_buffer: List[bytes] = []
+        self._stream_lock = asyncio.Lock()
+        # 各探测点的规则匹配部分与 outbound 无关，只构建一次（只读，与 config.probes 一一对应）
+        self._probe_rules: List[Mapping[str, Any]] = [
+            MappingProxyType({'type': 'field', **(probe.rules or {'domain': [f'domain:{probe.domain}']})})
+            for probe in self.config.probes
+        ]
 
     def _get_test_outbounds(self) -> List[Dict[str, Any]]:
         return self.outbounds_config.get('outbounds', [])
 
-    def _add_outbound(self, outbound: Dict[str, Any]) -> None:
-        import subprocess
-        import tempfile
-        
-        config = {'outbounds': [outbound]}
-        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.json', delete=False) as f:
-            json.dump(config, f)
-            temp_path = f.name
-        
-        try:
-            cmd = [self.config.xray_test.exe, 'api', 'ado', f'--server={self.config.xray_test.api}',  temp_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            if result.returncode != 0:
-                raise XrayAPIError(f"添加 outbound 失败: {result.stderr}")
-        finally:
-            Path(temp_path).unlink(missing_ok=True)
-
-    def _remove_outbound(self, tag: str) -> None:
-        import subprocess
-        
-        cmd = [self.config.xray_test.exe, 'api', 'rmo', f'--server={self.config.xray_test.api}', tag]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        if result.returncode != 0:
-            logging.warning(f"删除 outbound {tag} 失败: {result.stderr}")
-
-    def _get_outbound_address(self, outbound_tag: str) -> str:
-        for ob in self.outbounds_config.get('outbounds', []):
-            if ob.get('tag') == outbound_tag:
-                settings = ob.get('settings', {})
-                servers = settings.get('servers', [])
-                if servers:
-                    addr = servers[0].get('address', '')
-                    port = servers[0].get('port', '')
-                    return f"{addr}:{port}"
-        return ""
-
-    async def test_outbound(self, outbound_tag: str, address: str) -> None:
-        test_tag = f"test-rule-{outbound_tag}"
+    @staticmethod
+    def _outbound_address(ob: Dict[str, Any]) -> str:
+        """outbound 首个服务器的 "地址:端口"，没有服务器时为空"""
+        servers = (ob.get('settings') or {}).get('servers', [])
+        if not servers:
+            return ""
+        addr = servers[0].get('address', '')
+        port = servers[0].get('port', '')
+        return f"{addr}:{port}"
+
+    async def test_outbound(self, outbound_tag: str, address: str, slot: Optional[TestSlot] = None) -> List[TestResult]:
+        """
+        测试单个 outbound 下的全部探测点，返回各探测点的结果
+
+        指定测试入口时规则限定在该入口的 inbound 上，并经由其代理地址拨测；
+        不同 outbound 使用不同的测试入口，才能并行测试同一域名。
+        """
+        self._stats.setdefault(outbound_tag, _OutboundStats(address))
+        # 各探测点的规则按域名区分、互不影响，并发拨测；信号量限制同时打开的浏览器上下文数量
+        semaphore = asyncio.Semaphore(max(1, self.config.probe_concurrency))
+        probes = self.config.probes
+        results = await asyncio.gather(
+            *(
+                self._run_probe(probe, rule_template, outbound_tag, address, semaphore, slot)
+                for probe, rule_template in zip(probes, self._probe_rules)
+            ),
+            return_exceptions=True,
+        )
+        outbound_results = []
+        for probe, result in zip(probes, results):
+            if isinstance(result, BaseException):
+                logging.error(f"测试 {outbound_tag} -> {probe.name} 异常: {result}")
+                result = TestResult(
+                    outbound=outbound_tag,
+                    address=address,
+                    probe_name=probe.name,
+                    success=False,
+                    quality='blocked',
+                    latency_ms=0,
+                    request_latency_ms=0,
+                    reason=f"测试异常: {result}"
+                )
+            self._record(result)
+            outbound_results.append(result)
+        await self._flush_stream()
+        return outbound_results
+
+    async def _run_probe(
+        self,
+        probe: Probe,
+        rule_template: Mapping[str, Any],
+        outbound_tag: str,
+        address: str,
+        semaphore: asyncio.Semaphore,
+        slot: Optional[TestSlot] = None,
+    ) -> TestResult:
+        # 每个探测点使用唯一的规则标签，并发时互不覆盖
+        test_tag = f"test-rule-{outbound_tag}-{probe.name}-{uuid4().hex[:8]}"
         
-        for probe in self.config.probes:
+        async with semaphore:
             logging.info(f"测试 {outbound_tag} -> {probe.name}")
             
-            rule = {
-                'type': 'field',
-                'ruleTag': test_tag,
-                'outboundTag': outbound_tag
-            }
-            
-            if probe.rules:
-                rule.update(probe.rules)
-            else:
-                from urllib.parse import urlparse
-                domain = urlparse(probe.url).hostname
-                rule['domain'] = [f'domain:{domain}']
-            
-            try:
-                self.xray.remove_routing_rule(test_tag)
-            except XrayAPIError:
-                pass
+            rule = {**rule_template, 'ruleTag': test_tag, 'outboundTag': outbound_tag}
+            if slot is not None:
+                rule['inboundTag'] = [slot.inbound]
             
             try:
-                self.xray.add_routing_rule(rule)
+                await self.xray.add_routing_rule(rule)
             except XrayAPIError as e:
                 logging.error(f"添加测试规则失败: {e}")
-                self.results.append(TestResult(
+                return TestResult(
                     outbound=outbound_tag,
                     address=address,
                     probe_name=probe.name,
@@ -124,14 +191,20 @@ class OutboundTester:
                     latency_ms=0,
                     request_latency_ms=0,
                     reason=f"路由规则失败: {e}"
-                ))
-                continue
+                )
             
-            start = time.time()
-            outcome = await self.playwright.check(probe, self.config.proxy.test)
-            latency = int((time.time() - start) * 1000)
+            try:
+                # 单调时钟，不受系统时间调整影响
+                start = time.perf_counter_ns()
+                outcome = await self.playwright.check(probe, slot.proxy if slot else self.config.proxy.test)
+                latency = (time.perf_counter_ns() - start) // 1_000_000
+            finally:
+                try:
+                    await self.xray.remove_routing_rule(test_tag)
+                except XrayAPIError:
+                    pass
             
-            self.results.append(TestResult(
+            return TestResult(
                 outbound=outbound_tag,
                 address=address,
                 probe_name=probe.name,
@@ -140,40 +213,145 @@ class OutboundTester:
                 latency_ms=latency,
                 request_latency_ms=outcome.request_latency_ms,
                 reason=outcome.reason if not outcome.ok else ""
-            ))
-            
-            try:
-                self.xray.remove_routing_rule(test_tag)
-            except XrayAPIError:
-                pass
+            )
 
     async def run(self) -> None:
         test_outbounds = self._get_test_outbounds()
         logging.info(f"找到 {len(test_outbounds)} 个待测试 outbound")
         
-        added_tags = []
+        async with self.xray:
+            added = await self._add_outbounds(test_outbounds)
+            added_tags = [tag for tag, _ in added]
+            
+            try:
+                self._stream = await asyncio.to_thread(open, self.stream_file, 'wb')
+                async with self.playwright:
+                    await self._test_outbounds(added)
+            finally:
+                if self._stream is not None:
+                    await self._flush_stream()
+                    await asyncio.to_thread(self._stream.close)
+                    self._stream = None
+                # 测试中断时也要删除已添加的 outbound
+                try:
+                    await self.xray.remove_outbounds(added_tags)
+                    logging.info(f"删除 outbound: {', '.join(added_tags)}")
+                except XrayAPIError as e:
+                    logging.warning(f"删除 outbound 失败: {e}")
         
-        for ob in test_outbounds:
+        # 保存详细结果为JSON
+        await self._save_json_results()
+        self._print_results()
+
+    def _record(self, result: TestResult) -> None:
+        """更新汇总统计，并把结果加入 NDJSON 写入缓冲（每行一个 JSON 对象）"""
+        self._stats.setdefault(result.outbound, _OutboundStats(result.address)).add(result)
+        if self._stream is not None:
+            self._stream_buffer.append(jsonio.dumps(result.to_dict()) + b"\n")
+
+    async def _flush_stream(self) -> None:
+        """在线程中把缓冲的结果行写入 NDJSON 文件，不阻塞事件循环"""
+        async with self._stream_lock:
+            if self._stream is None or not self._stream_buffer:
+                return
+            lines, self._stream_buffer = self._stream_buffer, []
+            await asyncio.to_thread(_write_lines, self._stream, lines)
+
+    @staticmethod
+    def _validate_outbound(ob: Any, seen_tags: Set[str]) -> Optional[str]:
+        """本地检查 outbound 配置的基本结构，返回错误原因；只拦截明显无效的项，完整校验仍由 xray 完成"""
+        if not isinstance(ob, dict):
+            return "配置不是对象"
+        tag = ob.get('tag')
+        if not isinstance(tag, str) or not tag:
+            return "缺少 tag"
+        if tag in seen_tags:
+            return f"tag 重复: {tag}"
+        if not isinstance(ob.get('protocol'), str) or not ob['protocol']:
+            return "缺少 protocol"
+        settings = ob.get('settings') or {}
+        if not isinstance(settings, dict):
+            return "settings 不是对象"
+        # socks/http/shadowsocks/trojan 使用 servers，vmess/vless 使用 vnext
+        for key in ('servers', 'vnext'):
+            entries = settings.get(key)
+            if entries is None:
+                continue
+            if not isinstance(entries, list) or not all(isinstance(entry, dict) and entry.get('address') for entry in entries):
+                return f"settings.{key} 缺少 address"
+        return None
+
+    async def _add_outbounds(self, outbounds: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+        """添加待测试的 outbound，返回添加成功的 (tag, 地址)"""
+        # 先在本地剔除明显无效的配置，不为其启动 xray 进程
+        valid_outbounds = []
+        seen_tags: Set[str] = set()
+        for index, ob in enumerate(outbounds):
+            error = self._validate_outbound(ob, seen_tags)
+            if error:
+                logging.error(f"跳过第 {index + 1} 个 outbound: {error}")
+                continue
+            seen_tags.add(ob['tag'])
+            valid_outbounds.append(ob)
+        outbounds = valid_outbounds
+        if not outbounds:
+            return []
+        # 不使用一次 ado 批量添加：批量添加中途失败时已添加的前缀会留在 xray 中，
+        # 且无法与已存在的同名 outbound 区分；逐个添加时每个 tag 的成败都是确定的
+        # 各 outbound 的 ado 子进程并发执行
+        results = await asyncio.gather(
+            *(self.xray.add_outbound(ob) for ob in outbounds),
+            return_exceptions=True,
+        )
+        added = []
+        unexpected: Optional[BaseException] = None
+        for ob, result in zip(outbounds, results):
             tag = ob['tag']
-            try:
-                self._add_outbound(ob)
-                added_tags.append(tag)
+            if isinstance(result, XrayAPIError):
+                logging.error(f"添加 outbound {tag} 失败: {result}")
+            elif isinstance(result, BaseException):
+                unexpected = unexpected or result
+            else:
+                added.append((tag, self._outbound_address(ob)))
                 logging.info(f"添加 outbound: {tag}")
+        if unexpected is not None:
+            # 调用方拿不到已添加的 tag，抛出前自行删除
+            try:
+                await self.xray.remove_outbounds([tag for tag, _ in added])
             except XrayAPIError as e:
-                logging.error(f"添加 outbound {tag} 失败: {e}")
-                continue
-        
-        for tag in added_tags:
-            address = self._get_outbound_address(tag)
-            await self.test_outbound(tag, address)
-        
-        for tag in added_tags:
-            self._remove_outbound(tag)
-            logging.info(f"删除 outbound: {tag}")
-        
-        self._print_results()
+                logging.warning(f"删除 outbound 失败: {e}")
+            raise unexpected
+        return added
 
-    def _save_json_results(self) -> None:
+    async def _test_outbounds(self, outbounds: List[Tuple[str, str]]) -> None:
+        """
+        测试全部 outbound
+
+        配置了两组及以上测试入口（proxy.test_slots）时，每个 outbound 占用一个入口并行测试，
+        同时测试的 outbound 数量等于入口数量；否则逐个测试。
+        """
+        slots = self.config.proxy.test_slots
+        if len(slots) < 2:
+            for tag, address in outbounds:
+                self.results.extend(await self.test_outbound(tag, address))
+            return
+
+        free_slots: asyncio.Queue = asyncio.Queue()
+        for slot in slots:
+            free_slots.put_nowait(slot)
+
+        async def _gated(tag: str, address: str) -> List[TestResult]:
+            slot = await free_slots.get()
+            try:
+                return await self.test_outbound(tag, address, slot)
+            finally:
+                free_slots.put_nowait(slot)
+
+        # 各 outbound 的结果分别收集，全部完成后按顺序合并
+        for outbound_results in await asyncio.gather(*(_gated(tag, address) for tag, address in outbounds)):
+            self.results.extend(outbound_results)
+
+    async def _save_json_results(self) -> None:
         from datetime import datetime
         
         output = {
@@ -181,21 +359,13 @@ class OutboundTester:
             'results': [r.to_dict() for r in self.results]
         }
         
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
+        # 序列化和写文件都在线程中完成，不阻塞事件循环
+        output_path = Path(self.output_file)
+        await asyncio.to_thread(lambda: output_path.write_bytes(jsonio.dumps(output, indent=True)))
         
         logging.info(f"详细结果已保存到: {self.output_file}")
 
     def _print_results(self) -> None:
-        by_outbound: Dict[str, List[TestResult]] = {}
-        for r in self.results:
-            if r.outbound not in by_outbound:
-                by_outbound[r.outbound] = []
-            by_outbound[r.outbound].append(r)
-        
-        # 保存详细结果为JSON
-        self._save_json_results()
-        
         print("\n" + "="*150)
         print("测试结果汇总")
         print("="*150)
@@ -204,17 +374,11 @@ class OutboundTester:
         print(header)
         print("-"*150)
         
-        for outbound, results in by_outbound.items():
-            optimal_count = sum(1 for r in results if r.quality == 'optimal')
-            suboptimal_count = sum(1 for r in results if r.quality == 'suboptimal')
-            blocked_count = sum(1 for r in results if r.quality == 'blocked')
-            
-            success_results = [r for r in results if r.success]
-            avg_request_latency = int(sum(r.request_latency_ms for r in success_results) / len(success_results)) if success_results else 0
-            avg_total_latency = int(sum(r.latency_ms for r in success_results) / len(success_results)) if success_results else 0
-            address = results[0].address if results else ""
-            
-            print(f"{outbound:<35} {address:<25} {optimal_count:<8} {suboptimal_count:<8} {blocked_count:<8} {avg_request_latency}ms{'':<10} {avg_total_latency}ms")
+        for outbound, stats in self._stats.items():
+            n_success = max(stats.success, 1)
+            avg_request_latency = stats.total_request_latency_ms // n_success
+            avg_total_latency = stats.total_latency_ms // n_success
+            print(f"{outbound:<35} {stats.address:<25} {stats.optimal:<8} {stats.suboptimal:<8} {stats.blocked:<8} {avg_request_latency}ms{'':<10} {avg_total_latency}ms")
         
 
 def main():
@@ -223,7 +387,7 @@ def main():
     parser = argparse.ArgumentParser(description='测试 Xray outbound 节点质量')
     parser.add_argument('--config', '-c', default='config.json', help='配置文件路径 (默认: config.json)')
     parser.add_argument('--outbounds', '-o', default='test_outbounds_config.json', help='待测试 outbound 配置文件路径 (默认: test_outbounds_config.json)')
-    parser.add_argument('--output', '-O', default='test_results.json', help='JSON 输出文件路径 (默认: test_results.json)')
+    parser.add_argument('--output', '-O', default='test_results.json', help='JSON 输出文件路径，逐条结果同时实时写入 <输出文件>.ndjson (默认: test_results.json)')
     args = parser.parse_args()
     
     logging.basicConfig(
@@ -232,7 +396,8 @@ def main():
     )
     
     tester = OutboundTester(args.config, args.outbounds, args.output)
-    asyncio.run(tester.run())
+    run = uvloop.run if uvloop is not None else asyncio.run
+    run(tester.run())
 
 
 if __name__ == '__main__':
@@ -13,6 +13,11 @@ from scripts.modules.config import ConfigLoader, Expectation, Probe
 from scripts.modules.probe import PlaywrightProbe
 from scripts.modules.xray_client import XrayAPIClient, XrayAPIError
 
+try:
+    import uvloop  # 可选：基于 libuv 的事件循环，调度和 socket I/O 更快
+except ImportError:
+    uvloop = None
+
 
 async def test_single(url: str, outbound: str, config_path: str = "config.json", 
                      wait_seconds: int = 5, screenshot_dir: str = "screenshots"):
@@ -50,14 +55,13 @@ async def test_single(url: str, outbound: str, config_path: str = "config.json",
     try:
         # 添加路由规则
         logging.info(f"添加测试规则: {test_tag}")
-        xray.add_routing_rule(rule)
-        
-        # 等待规则生效
-        await asyncio.sleep(0.5)
+        # adrules 返回时规则已写入路由表，无需等待生效
+        await xray.add_routing_rule(rule)
         
         # 执行测试
         logging.info(f"开始访问: {url} (出站: {outbound})")
-        outcome = await playwright.check(probe, config.proxy.test)
+        async with playwright:
+            outcome = await playwright.check(probe, config.proxy.test)
         
         # 显示结果
         print("\n" + "="*60)
@@ -75,7 +79,7 @@ async def test_single(url: str, outbound: str, config_path: str = "config.json",
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             safe_domain = domain.replace(".", "_")
             screenshot_path = Path(screenshot_dir) / f"{safe_domain}_{outbound}_{timestamp}.png"
-            screenshot_path.write_bytes(outcome.screenshot_data)
+            await asyncio.to_thread(screenshot_path.write_bytes, outcome.screenshot_data)
             print(f"截图:     {screenshot_path.absolute()}")
         
         print("="*60 + "\n")
@@ -91,10 +95,11 @@ async def test_single(url: str, outbound: str, config_path: str = "config.json",
     finally:
         # 清理规则
         try:
-            xray.remove_routing_rule(test_tag)
+            await xray.remove_routing_rule(test_tag)
             logging.info(f"清理测试规则: {test_tag}")
         except XrayAPIError:
             pass
+        await xray.close()
 
 
 def main():
@@ -116,7 +121,8 @@ def main():
     
     # 运行测试
     try:
-        success = asyncio.run(test_single(
+        run = uvloop.run if uvloop is not None else asyncio.run
+        success = run(test_single(
             args.url,
             args.outbound,
             args.config,